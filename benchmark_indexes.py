@@ -0,0 +1,159 @@
+"""
+Show query plans and timings of the catalog listing queries before and
+after the listing indexes (store migration 0007) on a synthetic catalog.
+
+Builds a scratch SQLite database (never the configured one), loads
+--rows synthetic instruments with the indexes absent, EXPLAINs and times
+the queries the views issue, then applies 0007 and repeats. The scratch
+database is deleted afterwards unless --keep is given.
+
+Run with: python benchmark_indexes.py [--rows 1000000] [--database /tmp/bench.sqlite3] [--keep] [--json results.json]
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from decimal import Decimal
+
+parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+parser.add_argument("--rows", type=int, default=1_000_000, help="Synthetic instruments to create")
+parser.add_argument("--database", default="/tmp/daves_music_store_index_bench.sqlite3", help="Scratch SQLite file (recreated)")
+parser.add_argument("--repeat", type=int, default=5, help="Timed runs per query")
+parser.add_argument("--json", help="Also write the results to this JSON file")
+parser.add_argument("--keep", action="store_true", help="Keep the scratch database afterwards")
+args = parser.parse_args()
+
+
+def remove_database():
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(args.database + suffix):
+            os.remove(args.database + suffix)
+
+
+remove_database()
+
+# Point Django at the scratch database before setup
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.abspath(args.database)}"
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "daves_music_store.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test import RequestFactory  # noqa: E402
+
+from store import api_views, views  # noqa: E402
+from store.catalog import catalog_snapshot  # noqa: E402
+from store.models import Category, Instrument  # noqa: E402
+from store.pagination import KeysetPaginator  # noqa: E402
+
+BRANDS = ["Fender", "Gibson", "Yamaha", "Ibanez", "Roland", "Pearl", "Korg", "Martin", "Taylor", "PRS", "Selmer", "Ludwig"]
+CONDITIONS = [value for value, _ in Instrument.CONDITION_CHOICES]
+
+
+def load_catalog(rows, chunk_size=20_000):
+    categories = [
+        Category.objects.create(name=name, slug=slug)
+        for name, slug in [("Guitars", "guitars"), ("Bass Guitars", "bass-guitars"), ("Drums", "drums"), ("Keyboards", "keyboards"), ("Wind Instruments", "wind-instruments")]
+    ]
+    rng = random.Random(42)
+    for offset in range(0, rows, chunk_size):
+        batch = []
+        for index in range(offset, min(offset + chunk_size, rows)):
+            batch.append(
+                Instrument(
+                    name=f"Instrument {index}",
+                    slug=f"instrument-{index}",
+                    category=rng.choice(categories),
+                    brand=rng.choice(BRANDS),
+                    condition=rng.choices(CONDITIONS, weights=(70, 12, 10, 8))[0],
+                    price=Decimal(rng.randint(5_000, 500_000)) / 100,
+                    description="Synthetic benchmark instrument",
+                    in_stock=rng.random() < 0.8,
+                    featured=rng.random() < 0.02,
+                )
+            )
+        # bulk_create skips the search/facet signals, which the benchmark doesn't need
+        Instrument.objects.bulk_create(batch)
+        print(f"  loaded {min(offset + chunk_size, rows):,} / {rows:,}", end="\r", file=sys.stderr)
+    print(file=sys.stderr)
+    # auto_now_add stamps every row with the load time; spread them out instead
+    with connection.cursor() as cursor:
+        cursor.execute("UPDATE store_instrument SET created_at = datetime('2020-01-01', '+' || (id * 2) || ' minutes'), updated_at = created_at")
+
+
+def first_page(queryset, page_size):
+    # The query KeysetPaginator runs for a page without a cursor
+    return KeysetPaginator(queryset, page_size)._window(None)[0]
+
+
+def catalog_queries():
+    """The listing querysets, built by the same helpers the views use."""
+
+    factory = RequestFactory()
+    page_size = settings.STORE_PAGE_SIZE
+
+    def category_page(query=""):
+        return first_page(views._apply_filters(views.GUITARS_PAGE.queryset(), *views._parse_filters(factory.get(f"/guitars/?{query}"))), page_size)
+
+    api_params = factory.get("/api/instruments/").GET
+    brands, _ = views._product_list_filters(factory.get("/products/?brand=Gibson&brand=Fender"), catalog_snapshot())
+    return {
+        "home featured": views._featured_instruments(factory.get("/"))[0],
+        "category page": category_page(),
+        "category used filter": category_page("condition=used"),
+        "category deals": category_page("deals=1"),
+        "brand filter": first_page(brands, page_size),
+        "api default page": first_page(api_views._instrument_rows(api_params), api_views._api_page_size(api_params)),
+    }
+
+
+def measure(label):
+    print(f"\n=== {label} ===")
+    results = {}
+    for name, queryset in catalog_queries().items():
+        plan = queryset.explain()
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            list(queryset.all())
+            timings.append((time.perf_counter() - started) * 1000)
+        results[name] = {"plan": plan, "median_ms": round(statistics.median(timings), 3)}
+        print(f"\n{name}: {results[name]['median_ms']:.2f} ms")
+        print("  " + plan.replace("\n", "\n  "))
+    return results
+
+
+print(f"Building scratch catalog of {args.rows:,} instruments in {args.database}", file=sys.stderr)
+call_command("migrate", verbosity=0)
+call_command("migrate", "store", "0006", verbosity=0)
+load_catalog(args.rows)
+with connection.cursor() as cursor:
+    cursor.execute("ANALYZE")
+
+before = measure("before 0007 (FK and unique indexes only)")
+started = time.perf_counter()
+call_command("migrate", "store", "0007", verbosity=0)
+with connection.cursor() as cursor:
+    cursor.execute("ANALYZE")
+print(f"\n0007 applied in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+after = measure("after 0007 (listing indexes)")
+
+print("\n=== summary (median ms) ===")
+for name in before:
+    print(f"{name:<22} {before[name]['median_ms']:>10.2f} -> {after[name]['median_ms']:>8.2f}")
+
+if args.json:
+    with open(args.json, "w", encoding="utf-8") as out:
+        json.dump({"rows": args.rows, "vendor": connection.vendor, "before": before, "after": after}, out, indent=2)
+
+connection.close()
+if not args.keep:
+    remove_database()
@@ -0,0 +1,86 @@
+"""
+Build the ``DATABASES["default"]`` entry from a ``DATABASE_URL``.
+
+Supported schemes: ``sqlite`` (``sqlite:///relative.db``,
+``sqlite:////absolute/path.db``, ``sqlite://:memory:``), ``postgres`` /
+``postgresql`` and ``mysql``. Query parameters become backend
+``OPTIONS`` (e.g. ``?sslmode=require``).
+
+Connections are kept open between requests (``CONN_MAX_AGE``) and
+checked before reuse (``CONN_HEALTH_CHECKS``), so requests don't pay for
+connection setup. PostgreSQL can use psycopg 3's connection pool instead
+(``pool=True``; ``psycopg[pool]`` is in requirements.txt). SQLite connections switch
+to WAL journaling with ``synchronous=NORMAL`` and wait on locks instead
+of failing immediately.
+"""
+
+from pathlib import Path
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+ENGINES = {
+    "sqlite": "django.db.backends.sqlite3",
+    "postgres": "django.db.backends.postgresql",
+    "postgresql": "django.db.backends.postgresql",
+    "pgsql": "django.db.backends.postgresql",
+    "mysql": "django.db.backends.mysql",
+}
+
+SQLITE_INIT_COMMAND = "PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;"
+
+
+def parse_database_url(url, base_dir=None):
+    """Return a Django database settings dict (without connection tuning) for `url`."""
+
+    parts = urlsplit(url)
+    try:
+        engine = ENGINES[parts.scheme]
+    except KeyError:
+        raise ValueError(f"Unsupported DATABASE_URL scheme {parts.scheme!r}")
+
+    options = dict(parse_qsl(parts.query))
+    if engine == ENGINES["sqlite"]:
+        name = unquote(parts.netloc + parts.path)
+        if name in ("", "/", ":memory:", "/:memory:"):
+            name = ":memory:"
+        else:
+            # sqlite:///db.sqlite3 is relative, sqlite:////srv/db.sqlite3 absolute
+            name = name[1:] if name.startswith("/") else name
+            if base_dir is not None and not Path(name).is_absolute():
+                name = str(Path(base_dir) / name)
+        if "timeout" in options:
+            options["timeout"] = float(options["timeout"])
+        return {"ENGINE": engine, "NAME": name, "OPTIONS": options}
+
+    return {
+        "ENGINE": engine,
+        "NAME": unquote(parts.path.lstrip("/")),
+        "USER": unquote(parts.username or ""),
+        "PASSWORD": unquote(parts.password or ""),
+        # Unquote so socket directories can be given as %2Fvar%2Frun%2Fpostgresql
+        "HOST": unquote(parts.hostname or ""),
+        "PORT": str(parts.port or ""),
+        "OPTIONS": options,
+    }
+
+
+def database_config(url, base_dir=None, conn_max_age=600, health_checks=True, pool=None, sqlite_timeout=20):
+    """Return ``DATABASES["default"]`` for `url` with connection reuse configured.
+
+    `pool` is None (persistent connections) or a ``{"min_size": ...,
+    "max_size": ...}`` dict for psycopg's pool (PostgreSQL only; Django
+    requires ``CONN_MAX_AGE = 0`` with a pool).
+    """
+
+    config = parse_database_url(url, base_dir)
+    config["CONN_MAX_AGE"] = conn_max_age
+    config["CONN_HEALTH_CHECKS"] = health_checks
+
+    if config["ENGINE"] == ENGINES["sqlite"]:
+        config["OPTIONS"].setdefault("timeout", sqlite_timeout)
+        config["OPTIONS"].setdefault("init_command", SQLITE_INIT_COMMAND)
+        # Take the write lock up front so busy waits apply instead of deadlock errors
+        config["OPTIONS"].setdefault("transaction_mode", "IMMEDIATE")
+    elif pool and config["ENGINE"] == ENGINES["postgresql"]:
+        config["OPTIONS"]["pool"] = pool
+        config["CONN_MAX_AGE"] = 0
+    return config
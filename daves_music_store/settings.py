@@ -11,8 +11,11 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
 import os
+import tempfile
 from pathlib import Path
 
+from .database import database_config
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -50,9 +53,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so timings and query counts cover the rest of the stack
+    "store.middleware.MetricsMiddleware",
+    "store.middleware.QueryInspectionMiddleware",
     "django.middleware.security.SecurityMiddleware",
-    "whitenoise.middleware.WhiteNoiseMiddleware",
+    # WhiteNoise, with async support for ASGI deployments
+    "store.middleware.StaticFilesMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
+    "store.middleware.CookieCartMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
@@ -85,11 +93,22 @@ WSGI_APPLICATION = "daves_music_store.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# DATABASE_URL selects the backend (see daves_music_store.database);
+# defaults to the SQLite file next to manage.py. Connections persist for
+# DATABASE_CONN_MAX_AGE seconds, or come from psycopg's pool when
+# DATABASE_POOL_MAX_SIZE is set (PostgreSQL).
+
+_database_pool_size = int(os.environ.get("DATABASE_POOL_MAX_SIZE", "0"))
+
 DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
-    }
+    "default": database_config(
+        os.environ.get("DATABASE_URL", "sqlite:///db.sqlite3"),
+        base_dir=BASE_DIR,
+        conn_max_age=int(os.environ.get("DATABASE_CONN_MAX_AGE", "600")),
+        health_checks=os.environ.get("DATABASE_CONN_HEALTH_CHECKS", "True").lower() == "true",
+        pool={"min_size": int(os.environ.get("DATABASE_POOL_MIN_SIZE", "2")), "max_size": _database_pool_size} if _database_pool_size else None,
+        sqlite_timeout=float(os.environ.get("DATABASE_SQLITE_TIMEOUT", "20")),
+    )
 }
 
 
@@ -124,6 +143,33 @@ USE_I18N = True
 USE_TZ = True
 
 
+# Caches
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# "default" is the per-process LRU tier and "shared" the tier shared by
+# all workers; store.cache layers catalog page caching on top of both.
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "daves-music-store",
+        "OPTIONS": {"MAX_ENTRIES": 1000},
+    },
+    "shared": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.environ.get("STORE_SHARED_CACHE_LOCATION", os.path.join(tempfile.gettempdir(), "daves_music_store_cache")),
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    },
+}
+
+# Sessions
+# https://docs.djangoproject.com/en/5.2/topics/http/sessions/#configuring-the-session-engine
+# "db" (default), "cached_db" (reads served from the shared cache) or
+# "cache" (no database I/O; sessions can be evicted). Carts are keyed by
+# session key and work with any engine; see also STORE_CART_STORAGE.
+SESSION_ENGINE = "django.contrib.sessions.backends." + os.environ.get("DJANGO_SESSION_ENGINE", "db")
+SESSION_CACHE_ALIAS = "shared"
+
+
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/4.2/howto/static-files/
 
@@ -142,3 +188,67 @@ MEDIA_ROOT = BASE_DIR / "media"
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+# Store catalog settings
+# Page sizes for keyset-paginated listings (see store.pagination)
+STORE_PAGE_SIZE = int(os.environ.get("STORE_PAGE_SIZE", "24"))
+STORE_API_PAGE_SIZE = int(os.environ.get("STORE_API_PAGE_SIZE", "50"))
+STORE_API_MAX_PAGE_SIZE = int(os.environ.get("STORE_API_MAX_PAGE_SIZE", "200"))
+# Maximum operations accepted by /api/cart/batch/ (see store.carts)
+STORE_CART_BATCH_LIMIT = int(os.environ.get("STORE_CART_BATCH_LIMIT", "50"))
+# Where carts of visitors without a session live: "session" (a Cart row
+# keyed by the session, created on the first add) or "cookie" (a signed
+# cookie of instrument/quantity pairs, merged into a Cart row on checkout)
+STORE_CART_STORAGE = os.environ.get("STORE_CART_STORAGE", "session")
+STORE_CART_COOKIE_AGE = 60 * 60 * 24 * 14
+# Lines a cookie cart may hold before the next change moves it into a Cart
+# row, keeping the cookie well under browser size limits
+STORE_CART_COOKIE_MAX_LINES = int(os.environ.get("STORE_CART_COOKIE_MAX_LINES", "20"))
+# Abandoned cart purge (see store.carts and `manage.py purge_carts`)
+STORE_CART_MAX_AGE_DAYS = int(os.environ.get("STORE_CART_MAX_AGE_DAYS", "30"))
+STORE_EMPTY_CART_MAX_AGE_HOURS = int(os.environ.get("STORE_EMPTY_CART_MAX_AGE_HOURS", "24"))
+STORE_CART_PURGE_BATCH_SIZE = int(os.environ.get("STORE_CART_PURGE_BATCH_SIZE", "1000"))
+# Seconds between in-process purges; 0 disables the scheduler (use cron + purge_carts instead)
+STORE_CART_PURGE_INTERVAL = int(os.environ.get("STORE_CART_PURGE_INTERVAL", "0"))
+
+# Threads running a page's independent reads concurrently, each with its
+# own database connection (see store.batching); 0 runs them in sequence
+STORE_QUERY_BATCH_WORKERS = int(os.environ.get("STORE_QUERY_BATCH_WORKERS", "4"))
+
+# Route the catalog pages and /api/instruments through async views
+# (store.async_views); enable when serving daves_music_store.asgi
+STORE_ASYNC_VIEWS = os.environ.get("STORE_ASYNC_VIEWS", "False").lower() == "true"
+
+# Seconds between checks of the shared catalog version by each process's
+# snapshot of categories and facet counts (see store.catalog); 0 checks on every read
+STORE_CATALOG_SNAPSHOT_TTL = float(os.environ.get("STORE_CATALOG_SNAPSHOT_TTL", "0"))
+
+# Tiered catalog page cache (see store.cache)
+STORE_PAGE_CACHE_ENABLED = os.environ.get("STORE_PAGE_CACHE_ENABLED", "True").lower() == "true"
+STORE_CACHE_LOCAL_ALIAS = "default"
+STORE_CACHE_SHARED_ALIAS = "shared"
+STORE_CACHE_TIMEOUT = int(os.environ.get("STORE_CACHE_TIMEOUT", "600"))
+
+# Seconds between checks of MEDIA_ROOT/instruments for new images (see store.images)
+STORE_IMAGE_MANIFEST_TTL = int(os.environ.get("STORE_IMAGE_MANIFEST_TTL", "5"))
+# Widths (px) of the resized WebP/JPEG copies generated for each instrument image
+STORE_IMAGE_WIDTHS = (320, 640, 960)
+# Background threads rendering those copies after an image is saved; 0 renders them on commit
+STORE_IMAGE_DERIVATIVE_WORKERS = int(os.environ.get("STORE_IMAGE_DERIVATIVE_WORKERS", "1"))
+
+# Per-view request metrics served at /metrics (see store.metrics); off by default
+STORE_METRICS_ENABLED = os.environ.get("STORE_METRICS_ENABLED", "False").lower() == "true"
+# Also time template rendering (wraps Template.render while metrics are on)
+STORE_METRICS_TEMPLATE_TIMING = os.environ.get("STORE_METRICS_TEMPLATE_TIMING", "False").lower() == "true"
+# Where each worker writes its totals for /metrics to sum; empty it on deploy
+STORE_METRICS_DIR = os.environ.get("STORE_METRICS_DIR", os.path.join(tempfile.gettempdir(), "daves_music_store_metrics"))
+STORE_METRICS_FLUSH_INTERVAL = float(os.environ.get("STORE_METRICS_FLUSH_INTERVAL", "5"))
+STORE_METRICS_ALLOWED_IPS = os.environ.get("STORE_METRICS_ALLOWED_IPS", "127.0.0.1,::1").split(",")
+# Log requests slower than this (with their SQL) to the store.metrics logger
+# while metrics are on; 0 disables
+STORE_SLOW_REQUEST_MS = int(os.environ.get("STORE_SLOW_REQUEST_MS", "1000"))
+
+# Log N+1 patterns and query budget overruns per request (see store.querybudget)
+STORE_QUERY_INSPECTION = os.environ.get("STORE_QUERY_INSPECTION", str(DEBUG)).lower() == "true"
+# Repeats of one statement within a request that count as an N+1 pattern
+STORE_NPLUSONE_THRESHOLD = int(os.environ.get("STORE_NPLUSONE_THRESHOLD", "3"))
@@ -3,4 +3,12 @@ set -eu
 
 python manage.py migrate --noinput
 
+if [ "${SERVER_MODE:-wsgi}" = "asgi" ]; then
+    export STORE_ASYNC_VIEWS="${STORE_ASYNC_VIEWS:-True}"
+    # Persistent connections leak under ASGI (each request may run on a new
+    # thread); use DATABASE_POOL_MAX_SIZE to reuse connections instead
+    export DATABASE_CONN_MAX_AGE=0
+    exec gunicorn daves_music_store.asgi:application --bind 0.0.0.0:80 -k uvicorn_worker.UvicornWorker
+fi
+
 exec gunicorn daves_music_store.wsgi:application --bind 0.0.0.0:80
@@ -26,6 +26,10 @@ class CartItemInline(admin.TabularInline):
     model = CartItem
     extra = 0
     readonly_fields = ["added_at"]
+    raw_id_fields = ["instrument"]
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related("instrument")
 
 
 @admin.register(Cart)
@@ -34,12 +38,16 @@ class CartAdmin(admin.ModelAdmin):
     readonly_fields = ["session_key", "created_at", "updated_at"]
     inlines = [CartItemInline]
 
+    def get_queryset(self, request):
+        # Totals are aggregated in the database rather than per row
+        return super().get_queryset(request).with_totals()
+
     def get_item_count(self, obj):
-        return obj.get_item_count()
+        return obj.item_count or 0
 
     get_item_count.short_description = "Items"
 
     def get_total(self, obj):
-        return f"${obj.get_total()}"
+        return f"${obj.total_amount or 0}"
 
     get_total.short_description = "Total"
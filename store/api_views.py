@@ -2,68 +2,167 @@
 API views for the store app using Django REST framework.
 """
 
-from django.db.models import Q
+from functools import partial
+
+from django.conf import settings
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.views.decorators.http import require_GET
 from rest_framework import status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 
-from .models import Category, Instrument, CartItem
-from .serializers import CategorySerializer, InstrumentSerializer, CartSerializer
-from .views import get_or_create_cart
+from .carts import CartOperationError, apply_cart_operations, parse_cart_operations, set_cart_item_quantity
+from .catalog import catalog_snapshot
+from .conditional import catalog_condition, queryset_state
+from .export import export_rows, ndjson_lines
+from .models import Cart, Instrument
+from .pagination import InvalidCursor, page_size_from, paginate_request
+from .querybudget import query_budget
+from .search import search_instruments
+from .serializers import CategorySerializer, CartSerializer, InstrumentRowSerializer
+from .views import get_cart, get_or_create_cart, remember_cart_count
 
 
-@api_view(["GET"])
-def api_categories(request):
-    categories = Category.objects.all().order_by("name")
-    serializer = CategorySerializer(categories, many=True)
-    return Response({"results": serializer.data})
+def _filtered_instruments(params):
+    """Build the instrument queryset selected by the API query parameters."""
 
-
-@api_view(["GET"])
-def api_instruments(request):
     instruments = Instrument.objects.select_related("category").all()
 
-    category_slug = request.query_params.get("category")
+    category_slug = params.get("category")
     if category_slug:
         instruments = instruments.filter(category__slug=category_slug)
 
-    condition = request.query_params.get("condition")
+    condition = params.get("condition")
     if condition:
         instruments = instruments.filter(condition=condition)
 
-    selected_brands = request.query_params.getlist("brand")
+    selected_brands = params.getlist("brand")
     if selected_brands:
         instruments = instruments.filter(brand__in=selected_brands)
 
-    search_query = request.query_params.get("search")
+    search_query = params.get("search")
     if search_query:
-        instruments = instruments.filter(Q(name__icontains=search_query) | Q(brand__icontains=search_query) | Q(description__icontains=search_query))
+        instruments = search_instruments(instruments, search_query)
 
-    in_stock = request.query_params.get("in_stock")
+    in_stock = params.get("in_stock")
     if in_stock in {"true", "false"}:
         instruments = instruments.filter(in_stock=(in_stock == "true"))
     else:
         instruments = instruments.filter(in_stock=True)
 
-    serializer = InstrumentSerializer(instruments, many=True, context={"request": request})
+    return instruments
+
+
+def _categories_state(request):
+    # Category rows have no timestamp; the cache tag changes on every edit
+    return "categories", None
+
+
+def _instruments_state(request):
+    return queryset_state(_filtered_instruments(request.GET))
+
+
+def _instrument_detail_state(request, slug):
+    row = Instrument.objects.filter(slug=slug).values_list("id", "updated_at").first()
+    if row is None:
+        return None
+    return f"{row[0]}:{row[1]}", row[1]
+
+
+@query_budget(1)
+@catalog_condition(_categories_state)
+@api_view(["GET"])
+def api_categories(request):
+    # Read from the catalog snapshot, in `Category` (name) order
+    serializer = CategorySerializer(catalog_snapshot().categories, many=True)
     return Response({"results": serializer.data})
 
 
+@query_budget(3)
+@catalog_condition(_instruments_state)
+@api_view(["GET"])
+def api_instruments(request):
+    instruments = _instrument_rows(request.query_params)
+    try:
+        page = paginate_request(request, instruments, _api_page_size(request.query_params))
+    except InvalidCursor:
+        return Response({"error": "Invalid cursor"}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response(_instruments_payload(request, page))
+
+
+def _instrument_rows(params):
+    return InstrumentRowSerializer.rows(_filtered_instruments(params))
+
+
+def _api_page_size(params):
+    return page_size_from(params.get("page_size"), settings.STORE_API_PAGE_SIZE, settings.STORE_API_MAX_PAGE_SIZE)
+
+
+def _instruments_payload(request, page):
+    return {
+        "results": InstrumentRowSerializer(request).many(page.object_list),
+        "next": _page_url(request, page.next_query),
+        "previous": _page_url(request, page.previous_query),
+    }
+
+
+def _page_url(request, query):
+    if query is None:
+        return None
+    return request.build_absolute_uri(f"{request.path}?{query}")
+
+
+@query_budget(1)
+@require_GET
+def api_instruments_export(request):
+    """Stream every matching instrument as NDJSON (one object per line).
+
+    Accepts the same filters as `api_instruments` but is not paginated;
+    rows are read and encoded in chunks so memory use does not grow with
+    the catalog.
+    """
+
+    rows = export_rows(_filtered_instruments(request.GET), absolute=request.build_absolute_uri)
+    response = StreamingHttpResponse(ndjson_lines(rows), content_type="application/x-ndjson")
+    response["Content-Disposition"] = 'inline; filename="instruments.ndjson"'
+    return response
+
+
+@query_budget(3)
+@catalog_condition(_instrument_detail_state)
 @api_view(["GET"])
 def api_instrument_detail(request, slug):
-    instrument = get_object_or_404(Instrument.objects.select_related("category"), slug=slug)
-    serializer = InstrumentSerializer(instrument, context={"request": request})
-    return Response(serializer.data)
+    row = _instrument_detail_rows(slug).first()
+    if row is None:
+        raise Http404("No Instrument matches the given query.")
+    return Response(InstrumentRowSerializer(request).to_representation(row))
+
 
+def _instrument_detail_rows(slug):
+    return InstrumentRowSerializer.rows(Instrument.objects.filter(slug=slug))
 
+
+def _cart_response(request, cart, status_code=status.HTTP_200_OK):
+    if cart.pk is not None:
+        # Reload with items prefetched so serialization issues no per-item queries
+        cart = Cart.objects.with_items().get(pk=cart.pk)
+    remember_cart_count(request, cart.get_item_count())
+    serializer = CartSerializer(cart, context={"request": request})
+    return Response(serializer.data, status=status_code)
+
+
+@query_budget(4)
 @api_view(["GET"])
 def api_cart(request):
-    cart = get_or_create_cart(request)
+    cart = get_cart(request, with_items=True)
+    remember_cart_count(request, cart.get_item_count())
     serializer = CartSerializer(cart, context={"request": request})
     return Response(serializer.data)
 
 
+@query_budget(10)
 @api_view(["POST"])
 def api_cart_add(request):
     slug = request.data.get("slug")
@@ -81,19 +180,33 @@ def api_cart_add(request):
         return Response({"error": "Quantity must be greater than 0"}, status=status.HTTP_400_BAD_REQUEST)
 
     instrument = get_object_or_404(Instrument, slug=slug)
-    cart = get_or_create_cart(request)
+    cart = get_or_create_cart(request, add={instrument.pk: quantity})
 
-    cart_item, created = CartItem.objects.get_or_create(cart=cart, instrument=instrument)
-    if created:
-        cart_item.quantity = quantity
-    else:
-        cart_item.quantity += quantity
-    cart_item.save()
+    return _cart_response(request, cart)
 
-    serializer = CartSerializer(cart, context={"request": request})
-    return Response(serializer.data, status=status.HTTP_200_OK)
+
+@query_budget(11)
+@api_view(["POST"])
+def api_cart_batch(request):
+    """Apply several cart operations in one transaction.
+
+    Body: ``{"operations": [{"op": "add", "slug": ..., "quantity": n},
+    {"op": "update", "item_id": ..., "quantity": n}, {"op": "remove",
+    "slug": ...}, ...]}``. ``update``/``remove`` accept a slug or an
+    item_id. Nothing is written if any operation is invalid.
+    """
+
+    try:
+        operations = parse_cart_operations(request.data.get("operations"), settings.STORE_CART_BATCH_LIMIT)
+        # Validated against the current cart before anything is created
+        cart = apply_cart_operations(get_cart(request), operations, partial(get_or_create_cart, request))
+    except CartOperationError as error:
+        return Response({"error": str(error), "operation": error.index}, status=status.HTTP_400_BAD_REQUEST)
+
+    return _cart_response(request, cart)
 
 
+@query_budget(7)
 @api_view(["POST"])
 def api_cart_item_update(request, item_id):
     quantity = request.data.get("quantity")
@@ -106,23 +219,16 @@ def api_cart_item_update(request, item_id):
     except (TypeError, ValueError):
         return Response({"error": "Invalid quantity"}, status=status.HTTP_400_BAD_REQUEST)
 
-    cart_item = get_object_or_404(CartItem, id=item_id)
-    if quantity <= 0:
-        cart_item.delete()
-    else:
-        cart_item.quantity = quantity
-        cart_item.save()
-
-    cart = get_or_create_cart(request)
-    serializer = CartSerializer(cart, context={"request": request})
-    return Response(serializer.data, status=status.HTTP_200_OK)
+    cart = get_cart(request)
+    if not set_cart_item_quantity(cart, item_id, quantity):
+        raise Http404("No such item in your cart")
+    return _cart_response(request, cart)
 
 
+@query_budget(7)
 @api_view(["POST"])
 def api_cart_item_remove(request, item_id):
-    cart_item = get_object_or_404(CartItem, id=item_id)
-    cart_item.delete()
-
-    cart = get_or_create_cart(request)
-    serializer = CartSerializer(cart, context={"request": request})
-    return Response(serializer.data, status=status.HTTP_200_OK)
+    cart = get_cart(request)
+    if not set_cart_item_quantity(cart, item_id, 0):
+        raise Http404("No such item in your cart")
+    return _cart_response(request, cart)
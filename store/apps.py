@@ -4,3 +4,14 @@ from django.apps import AppConfig
 class StoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'store'
+
+    def ready(self):
+        # Connect the handlers that keep derived data in sync (see store.signals)
+        from . import signals  # noqa: F401
+
+        from django.conf import settings
+
+        if getattr(settings, "STORE_CART_PURGE_INTERVAL", 0):
+            from .carts import start_purge_scheduler
+
+            start_purge_scheduler(settings.STORE_CART_PURGE_INTERVAL)
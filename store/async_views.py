@@ -0,0 +1,229 @@
+"""
+store.async_views
+-----------------
+
+Async versions of the read-heavy catalog and API views, for ASGI
+deployments.
+
+With ``STORE_ASYNC_VIEWS`` enabled, ``store.urls`` routes the names in
+`ASYNC_VIEWS` here instead of to `store.views` / `store.api_views`.
+Each view renders the same template or JSON as its sync counterpart
+but reads through the async ORM and starts independent queries together
+with ``asyncio.gather`` (featured instruments, categories and brand
+facets on the homepage, for example). While a request waits on the
+database or on a slow client, the worker's event loop goes on serving
+other requests.
+
+Notes:
+- Django runs async ORM queries on the request's sync thread, so
+  gathered queries overlap with other requests' work rather than with
+  each other on the same connection.
+- Template rendering runs through ``sync_to_async``: context processors
+  read the session. Querysets the templates use are evaluated first so
+  templates never query.
+- The API views return the bytes DRF's ``JSONRenderer`` would, without
+  DRF's request wrapper, so they don't serve the browsable API.
+- Querysets, filters and template contexts come from the helpers the
+  sync views use; only the awaiting is done here.
+"""
+
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.shortcuts import aget_object_or_404, render
+from django.urls import path
+from django.views.decorators.http import require_safe
+from rest_framework.renderers import JSONRenderer
+
+from . import api_views, views
+from .cache import add_cache_tags, cached_catalog_page
+from .catalog import acatalog_snapshot
+from .conditional import catalog_condition
+from .export import aexport_rows, andjson_lines
+from .facets import FacetCounts
+from .models import Instrument
+from .pagination import InvalidCursor, apaginate_request
+from .querybudget import query_budget
+from .serializers import InstrumentRowSerializer
+
+arender = sync_to_async(render)
+
+
+async def _list(queryset):
+    return [obj async for obj in queryset]
+
+
+async def _paginate(request, queryset, page_size=None):
+    try:
+        return await apaginate_request(request, queryset, page_size)
+    except InvalidCursor:
+        raise Http404("Invalid page cursor")
+
+
+def _json(data, status=200):
+    return HttpResponse(JSONRenderer().render(data), status=status, content_type="application/json")
+
+
+@query_budget(2)
+@cached_catalog_page("instruments", "categories")
+async def home(request):
+    """Async `store.views.home`."""
+
+    featured, selected_brands = views._featured_instruments(request)
+    featured, snapshot = await asyncio.gather(_list(featured), acatalog_snapshot())
+    return await arender(request, "store/home.html", views._home_context(featured, selected_brands, snapshot))
+
+
+@query_budget(3)
+@cached_catalog_page("instruments", "categories")
+async def product_list(request):
+    """Async `store.views.product_list`."""
+
+    snapshot = await acatalog_snapshot()
+    instruments, filters = views._product_list_filters(request, snapshot)
+    page, result_count = await asyncio.gather(_paginate(request, instruments), instruments.acount())
+    return await arender(request, "store/product_list.html", views._product_list_context(page, result_count, filters, snapshot))
+
+
+@query_budget(3)
+@cached_catalog_page("categories")
+async def product_detail(request, slug):
+    """Async `store.views.product_detail`."""
+
+    instrument = await aget_object_or_404(Instrument.objects.select_related("category"), slug=slug)
+    add_cache_tags(request, f"instrument:{instrument.slug}", f"category:{instrument.category.slug}")
+    context = {
+        "instrument": instrument,
+        "related_instruments": await _list(views._related_instruments(instrument)),
+    }
+    return await arender(request, "store/product_detail.html", context)
+
+
+async def _category_page(request, page):
+    """Async `store.views._render_category_page`."""
+
+    filters = views._parse_filters(request)
+    queryset = page.queryset()
+    snapshot = await acatalog_snapshot()
+    instruments = _paginate(request, views._apply_filters(queryset, *filters))
+    if page.category_slug:
+        instruments, facets = await instruments, snapshot.facets(page.category_slug)
+    else:
+        instruments, facets = await asyncio.gather(instruments, _brand_facets(queryset))
+    context = views._category_page_context(page, instruments, facets, snapshot.categories, filters)
+    return await arender(request, page.template, context)
+
+
+async def _brand_facets(queryset):
+    return FacetCounts(brands=tuple([row async for row in views._brand_counts(queryset)]))
+
+
+@query_budget(2)
+@cached_catalog_page(*views.GUITARS_PAGE.cache_tags)
+async def guitars_page(request):
+    """Async `store.views.guitars_page`."""
+
+    return await _category_page(request, views.GUITARS_PAGE)
+
+
+@query_budget(2)
+@cached_catalog_page(*views.BASSES_PAGE.cache_tags)
+async def basses_page(request):
+    """Async `store.views.basses_page`."""
+
+    return await _category_page(request, views.BASSES_PAGE)
+
+
+@query_budget(2)
+@cached_catalog_page(*views.DRUMS_PAGE.cache_tags)
+async def drums_page(request):
+    """Async `store.views.drums_page`."""
+
+    return await _category_page(request, views.DRUMS_PAGE)
+
+
+@query_budget(2)
+@cached_catalog_page(*views.HORNS_PAGE.cache_tags)
+async def horns_page(request):
+    """Async `store.views.horns_page`."""
+
+    return await _category_page(request, views.HORNS_PAGE)
+
+
+@query_budget(2)
+@cached_catalog_page(*views.KEYBOARDS_PAGE.cache_tags)
+async def keyboards_page(request):
+    """Async `store.views.keyboards_page`."""
+
+    return await _category_page(request, views.KEYBOARDS_PAGE)
+
+
+@query_budget(3)
+@cached_catalog_page(*views.AMPS_EFFECTS_PAGE.cache_tags)
+async def amps_effects_page(request):
+    """Async `store.views.amps_effects_page`."""
+
+    return await _category_page(request, views.AMPS_EFFECTS_PAGE)
+
+
+@query_budget(3)
+@catalog_condition(api_views._instruments_state)
+@require_safe
+async def api_instruments(request):
+    """Async `store.api_views.api_instruments`."""
+
+    instruments = api_views._instrument_rows(request.GET)
+    try:
+        page = await apaginate_request(request, instruments, api_views._api_page_size(request.GET))
+    except InvalidCursor:
+        return _json({"error": "Invalid cursor"}, status=400)
+
+    return _json(api_views._instruments_payload(request, page))
+
+
+@query_budget(1)
+@require_safe
+async def api_instruments_export(request):
+    """Async `store.api_views.api_instruments_export`."""
+
+    rows = aexport_rows(api_views._filtered_instruments(request.GET), absolute=request.build_absolute_uri)
+    response = StreamingHttpResponse(andjson_lines(rows), content_type="application/x-ndjson")
+    response["Content-Disposition"] = 'inline; filename="instruments.ndjson"'
+    return response
+
+
+@query_budget(3)
+@catalog_condition(api_views._instrument_detail_state)
+@require_safe
+async def api_instrument_detail(request, slug):
+    """Async `store.api_views.api_instrument_detail`."""
+
+    row = await api_views._instrument_detail_rows(slug).afirst()
+    if row is None:
+        # DRF's rendering of Http404
+        return _json({"detail": "No Instrument matches the given query."}, status=404)
+    return _json(InstrumentRowSerializer(request).to_representation(row))
+
+
+# Route name -> async view
+ASYNC_VIEWS = {
+    "home": home,
+    "product_list": product_list,
+    "product_detail": product_detail,
+    "guitars": guitars_page,
+    "basses": basses_page,
+    "drums": drums_page,
+    "horns": horns_page,
+    "keyboards": keyboards_page,
+    "amps_effects": amps_effects_page,
+    "api_instruments": api_instruments,
+    "api_instruments_export": api_instruments_export,
+    "api_instrument_detail": api_instrument_detail,
+}
+
+
+def use_async_views(urlpatterns):
+    """Return `urlpatterns` with the routes named in `ASYNC_VIEWS` pointing at their async views."""
+
+    return [path(str(pattern.pattern), ASYNC_VIEWS[pattern.name], name=pattern.name) if pattern.name in ASYNC_VIEWS else pattern for pattern in urlpatterns]
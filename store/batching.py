@@ -0,0 +1,114 @@
+"""
+store.batching
+--------------
+
+Run a page's independent reads concurrently.
+
+The homepage needs featured instruments, the categories and the brand
+facets; category pages need a page of instruments, the facets and the
+categories. None of these reads depends on another, so `fetch_together`
+issues them at once on a small thread pool and returns the results in
+order. Django opens one connection per thread, so each read gets its own
+connection and the page waits for the slowest query instead of the sum.
+
+The reads run one after another in the calling thread when:
+
+- ``STORE_QUERY_BATCH_WORKERS`` is 0,
+- the caller is inside a transaction: other connections can't see its
+  uncommitted writes (tests run inside one), or
+- there is a single read.
+
+Each pool thread opens its connection on its first read and keeps it
+until the thread exits, whatever ``CONN_MAX_AGE`` says (with 0, closing
+after every read would mean a new connection per read); a connection
+is only replaced early after a database error. So each worker process
+holds up to ``STORE_QUERY_BATCH_WORKERS`` extra connections. SQL execute wrappers installed on the caller's connection
+(request metrics, query inspection) are installed on the pool thread's
+connection for the read, so its queries are still counted.
+"""
+
+import contextvars
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import QuerySet
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=settings.STORE_QUERY_BATCH_WORKERS, thread_name_prefix="store-batch")
+    return _executor
+
+
+def _evaluate(read):
+    if isinstance(read, QuerySet):
+        return list(read)
+    return read()
+
+
+class _ThreadToken:
+    """Held only by a pool thread's locals, so it is collected when the thread ends."""
+
+
+_local = threading.local()
+
+
+def _close_connection(connection):
+    # Runs as the pool thread exits, possibly after it has let go of the wrapper
+    connection.inc_thread_sharing()
+    connection.close()
+
+
+def _pool_connection(using):
+    """Return this pool thread's connection to `using`, closed when the thread exits."""
+
+    connection = connections[using]
+    tokens = _local.__dict__.setdefault("tokens", {})
+    if using not in tokens:
+        tokens[using] = _ThreadToken()
+        weakref.finalize(tokens[using], _close_connection, connection)
+    elif connection.connection is not None and connection.errors_occurred:
+        # Like request handling, drop a connection left unusable by an error
+        if connection.is_usable():
+            connection.errors_occurred = False
+        else:
+            connection.close()
+    return connection
+
+
+def _read_on_pool_thread(read, using, wrappers):
+    connection = _pool_connection(using)
+    with ExitStack() as stack:
+        for wrapper in wrappers:
+            stack.enter_context(connection.execute_wrapper(wrapper))
+        return _evaluate(read)
+
+
+def fetch_together(*reads, using=DEFAULT_DB_ALIAS):
+    """Evaluate `reads` concurrently and return their results as a list, in order.
+
+    Each read is a queryset (evaluated to a list) or a callable taking no
+    arguments. An exception raised by a read is re-raised here.
+    """
+
+    connection = connections[using]
+    if len(reads) < 2 or not settings.STORE_QUERY_BATCH_WORKERS or connection.in_atomic_block:
+        return [_evaluate(read) for read in reads]
+
+    wrappers = list(connection.execute_wrappers)
+    executor = _get_executor()
+    futures = [
+        executor.submit(contextvars.copy_context().run, _read_on_pool_thread, read, using, wrappers)
+        for read in reads
+    ]
+    return [future.result() for future in futures]
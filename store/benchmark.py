@@ -0,0 +1,212 @@
+"""
+store.benchmark
+---------------
+
+Repeatable latency benchmark for every route in ``store.urls``.
+
+A small locust-style runner: `users` virtual users, each a thread with
+its own test ``Client`` (and so its own session and cart), work through
+every scenario in a shuffled order per round. Each request is timed
+end to end (streamed bodies included) and its database queries counted,
+and the results are summarized per route as p50/p95/p99 latency and
+query counts. Run it through ``manage.py benchmark_catalog``, which
+stores the summary as JSON so runs from different commits can be
+compared.
+
+Routes that need an existing cart line (update/remove) first add one
+outside the timed section. Each virtual user deletes its session and
+cart when it finishes, so runs leave no rows behind.
+"""
+
+import random
+import statistics
+import threading
+import time
+from dataclasses import dataclass, field
+from functools import partial
+from importlib import import_module
+
+from django.conf import settings
+from django.db import connections
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from . import urls
+from .models import Cart, Instrument
+from .querybudget import QueryInspector
+
+
+@dataclass
+class Scenario:
+    """How to exercise one named route."""
+
+    method: str = "get"
+    args: callable = None  # (fixtures, client) -> URL args
+    data: callable = None  # (fixtures, client) -> request data
+    query: str = ""
+    json: bool = False
+
+
+@dataclass
+class Fixtures:
+    slugs: list
+    rng: random.Random = field(default_factory=random.Random)
+
+    def slug(self):
+        return self.rng.choice(self.slugs)
+
+
+def _cart_line(fixtures, client):
+    # Untimed setup: add an instrument and return its line id
+    data = client.post(reverse("api_cart_add"), {"slug": fixtures.slug()}, content_type="application/json").json()
+    return [data["items"][-1]["id"]]
+
+
+SCENARIOS = {
+    "home": Scenario(),
+    "guitars": Scenario(),
+    "basses": Scenario(),
+    "drums": Scenario(),
+    "horns": Scenario(),
+    "keyboards": Scenario(),
+    "amps_effects": Scenario(),
+    "lessons": Scenario(),
+    "product_list": Scenario(query="condition=new"),
+    "category_list": Scenario(),
+    "product_detail": Scenario(args=lambda f, c: [f.slug()]),
+    "cart_view": Scenario(),
+    "add_to_cart": Scenario(args=lambda f, c: [f.slug()]),
+    "update_cart_item": Scenario("post", args=_cart_line, data=lambda f, c: {"quantity": 2}),
+    "remove_from_cart": Scenario(args=_cart_line),
+    "checkout": Scenario("post"),
+    "metrics": Scenario(),
+    "api_categories": Scenario(),
+    "api_instruments": Scenario(),
+    "api_instruments_export": Scenario(query="category=guitars"),
+    "api_instrument_detail": Scenario(args=lambda f, c: [f.slug()]),
+    "api_cart": Scenario(),
+    "api_cart_add": Scenario("post", data=lambda f, c: {"slug": f.slug(), "quantity": 1}, json=True),
+    "api_cart_batch": Scenario(
+        "post",
+        data=lambda f, c: {"operations": [{"op": "add", "slug": f.slug()} for _ in range(5)]},
+        json=True,
+    ),
+    "api_cart_item_update": Scenario("post", args=_cart_line, data=lambda f, c: {"quantity": 3}, json=True),
+    "api_cart_item_remove": Scenario("post", args=_cart_line),
+}
+
+
+def uncovered_routes():
+    """Names of routes in ``store.urls`` that have no scenario."""
+
+    return sorted({pattern.name for pattern in urls.urlpatterns} - SCENARIOS.keys())
+
+
+def percentile(values, percent):
+    """Nearest-rank percentile of `values`."""
+
+    if not values:
+        raise ValueError("percentile() needs at least one value")
+    ordered = sorted(values)
+    rank = max(1, round(percent / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def prepare_request(client, name, fixtures):
+    """Run the untimed setup of `name`'s scenario and return a callable issuing its request."""
+
+    scenario = SCENARIOS[name]
+    args = scenario.args(fixtures, client) if scenario.args else []
+    url = reverse(name, args=args)
+    if scenario.query:
+        url = f"{url}?{scenario.query}"
+    data = scenario.data(fixtures, client) if scenario.data else None
+    kwargs = {"content_type": "application/json"} if scenario.json else {}
+    return partial(getattr(client, scenario.method), url, data, **kwargs)
+
+
+def _request(client, name, fixtures):
+    send = prepare_request(client, name, fixtures)
+    # An execute wrapper, so reads run by store.batching are counted too
+    with QueryInspector() as queries:
+        started = time.perf_counter()
+        response = send()
+        # Streamed bodies do their work while being consumed
+        if getattr(response, "streaming", False):
+            b"".join(response.streaming_content)
+        elapsed = time.perf_counter() - started
+    return elapsed, queries.count, response.status_code
+
+
+def discard_visitor(client):
+    """Delete the session and cart that `client` created, if any."""
+
+    cookie = client.cookies.get(settings.SESSION_COOKIE_NAME)
+    if cookie is None or not cookie.value:
+        return
+    Cart.objects.filter(session_key=cookie.value).delete()
+    import_module(settings.SESSION_ENGINE).SessionStore(cookie.value).delete()
+
+
+def run_benchmark(names=None, users=4, rounds=20, warmup=1, seed=0):
+    """Run the scenarios for `names` (default: all) and return per-route stats."""
+
+    names = list(names or SCENARIOS)
+    slugs = list(Instrument.objects.filter(in_stock=True).order_by("?").values_list("slug", flat=True)[:500])
+    if not slugs:
+        raise ValueError("The catalog is empty; run load_initial_data or generate_catalog first")
+
+    samples = {name: [] for name in names}
+    errors = []
+    lock = threading.Lock()
+
+    def user(number):
+        fixtures = Fixtures(slugs, random.Random(seed + number))
+        client = Client()
+        try:
+            for round_number in range(warmup + rounds):
+                order = names[:]
+                fixtures.rng.shuffle(order)
+                for name in order:
+                    result = _request(client, name, fixtures)
+                    if round_number >= warmup:
+                        with lock:
+                            samples[name].append(result)
+        except Exception as error:
+            errors.append(error)
+        finally:
+            discard_visitor(client)
+            connections.close_all()
+
+    # The test client's host must be allowed whatever the deployment settings say
+    with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]):
+        threads = [threading.Thread(target=user, args=(number,)) for number in range(users)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - started
+    if errors:
+        raise errors[0]
+
+    results = {}
+    for name, runs in samples.items():
+        if not runs:
+            # No timed request ran, e.g. with rounds=0; there is nothing to summarise
+            results[name] = {"requests": 0}
+            continue
+        latencies = [elapsed * 1000 for elapsed, _, _ in runs]
+        query_counts = [count for _, count, _ in runs]
+        results[name] = {
+            "requests": len(runs),
+            "p50_ms": round(percentile(latencies, 50), 3),
+            "p95_ms": round(percentile(latencies, 95), 3),
+            "p99_ms": round(percentile(latencies, 99), 3),
+            "mean_ms": round(statistics.fmean(latencies), 3),
+            "queries_median": statistics.median(query_counts),
+            "queries_max": max(query_counts),
+            "status_codes": sorted({status for _, _, status in runs}),
+        }
+    total = sum(result["requests"] for result in results.values())
+    return {"wall_seconds": round(wall, 3), "requests_per_second": round(total / wall, 1), "routes": results}
@@ -0,0 +1,233 @@
+"""
+store.cache
+-----------
+
+Tiered response cache for the catalog pages.
+
+Catalog pages change a few times a day but were re-queried and
+re-rendered on every hit. ``cached_catalog_page`` stores rendered
+responses in two tiers:
+
+- a per-process LRU tier (``STORE_CACHE_LOCAL_ALIAS``, locmem by default)
+- a tier shared by all workers (``STORE_CACHE_SHARED_ALIAS``, file-based
+  by default)
+
+Entries are keyed by view name, URL arguments and the normalized filter
+query string, and are tagged (e.g. ``instruments``, ``category:guitars``,
+``instrument:<slug>``). Each tag has a version token in the shared tier;
+an entry is only served while all of its tags still carry the versions
+recorded when it was rendered. ``invalidate_tags`` (called from the
+model signals in ``store.signals``) replaces those tokens, which drops
+every dependent entry in every worker at once.
+
+The per-visitor cart badge is rendered as a placeholder and substituted
+on the way out, so cached pages never carry another visitor's count.
+"""
+
+import hashlib
+import uuid
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+
+# Query parameters that change what catalog views render
+CACHE_QUERY_PARAMS = ("brand", "category", "condition", "cursor", "deals", "search")
+
+# Rendered in place of the cart badge count while a cacheable page renders
+CART_BADGE_PLACEHOLDER = "__store_cart_item_count__"
+
+_TAG_PREFIX = "store:tag:"
+# Bumped whenever the entry format changes
+_PAGE_PREFIX = "store:page:v2:"
+
+
+def _local():
+    return caches[getattr(settings, "STORE_CACHE_LOCAL_ALIAS", "default")]
+
+
+def _shared():
+    return caches[getattr(settings, "STORE_CACHE_SHARED_ALIAS", "shared")]
+
+
+def _timeout():
+    return getattr(settings, "STORE_CACHE_TIMEOUT", 600)
+
+
+def normalized_query(request):
+    """Return a canonical query string built from the cache-relevant params."""
+
+    parts = []
+    for name in CACHE_QUERY_PARAMS:
+        values = request.GET.getlist(name)
+        if name == "brand":
+            values = sorted(set(values))
+        parts.extend(f"{name}={value}" for value in values)
+    return "&".join(parts)
+
+
+def page_cache_key(view_name, request, view_kwargs):
+    raw = "|".join(
+        [
+            view_name,
+            request.method,
+            ",".join(f"{key}={value}" for key, value in sorted(view_kwargs.items())),
+            normalized_query(request),
+        ]
+    )
+    return _PAGE_PREFIX + hashlib.sha256(raw.encode()).hexdigest()
+
+
+def tag_versions(tags):
+    """Return the current version token of every tag, creating missing ones."""
+
+    shared = _shared()
+    keys = {tag: _TAG_PREFIX + tag for tag in tags}
+    found = shared.get_many(keys.values())
+    versions = {}
+    for tag, key in keys.items():
+        version = found.get(key)
+        if version is None:
+            version = uuid.uuid4().hex
+            # Another worker may have created it first; use whichever won
+            if not shared.add(key, version, None):
+                version = shared.get(key, version)
+        versions[tag] = version
+    return versions
+
+
+def invalidate_tags(*tags):
+    """Invalidate every cached page carrying any of `tags`."""
+
+    _shared().set_many({_TAG_PREFIX + tag: uuid.uuid4().hex for tag in tags}, None)
+
+
+def add_cache_tags(request, *tags):
+    """Attach extra tags to the page being rendered (e.g. after a lookup)."""
+
+    if hasattr(request, "_store_cache_tags"):
+        request._store_cache_tags.update(tags)
+
+
+def _get(key):
+    local = _local()
+    entry = local.get(key)
+    if entry is None:
+        entry = _shared().get(key)
+        if entry is not None:
+            local.set(key, entry, _timeout())
+    if entry is None:
+        return None
+
+    # Serve only while every tag still has the version the entry saw
+    if tag_versions(entry["tags"]) != entry["tags"]:
+        return None
+    return entry
+
+
+def _set(key, entry):
+    _local().set(key, entry, _timeout())
+    _shared().set(key, entry, _timeout())
+
+
+def _with_badge(request, content):
+    from .context_processors import cart_badge_count
+
+    return content.replace(CART_BADGE_PLACEHOLDER.encode(), str(cart_badge_count(request)).encode())
+
+
+def _cacheable(request):
+    return request.method in ("GET", "HEAD") and getattr(settings, "STORE_PAGE_CACHE_ENABLED", True)
+
+
+def _lookup(view_name, tags, request, view_kwargs):
+    """Return ``(key, entry, versions)``; `entry` is None on a miss, ready to render."""
+
+    key = page_cache_key(view_name, request, view_kwargs)
+    entry = _get(key)
+    if entry is not None:
+        return key, entry, None
+    request._store_cache_tags = set(tags)
+    versions = tag_versions(request._store_cache_tags)
+    request._store_defer_cart_badge = True
+    return key, None, versions
+
+
+def _store(request, key, versions, response):
+    """Cache a freshly rendered `response` if it qualifies and return what to send."""
+
+    if getattr(response, "streaming", False):
+        return response
+    if response.status_code != 200 or response.cookies:
+        response.content = _with_badge(request, response.content)
+        return response
+
+    # Declared tags are versioned before rendering so a change made
+    # while the page renders leaves the entry stale, not current.
+    versions.update(tag_versions(request._store_cache_tags - versions.keys()))
+    entry = {
+        "content": response.content,
+        # Everything but the length, which the badge substitution changes
+        "headers": [(name, value) for name, value in response.items() if name.lower() != "content-length"],
+        "tags": versions,
+    }
+    _set(key, entry)
+    return _serve(request, entry)
+
+
+def _serve(request, entry):
+    response = HttpResponse(_with_badge(request, entry["content"]))
+    for name, value in entry["headers"]:
+        response[name] = value
+    return response
+
+
+def cached_catalog_page(*tags):
+    """Serve a catalog view from the tiered cache.
+
+    `tags` are the invalidation tags of every page the view renders;
+    views can add per-object tags at render time with `add_cache_tags`.
+    Only successful GET/HEAD responses that set no cookies are stored.
+    Disabled when ``STORE_PAGE_CACHE_ENABLED`` is false. Works for sync
+    and async views alike; async views reach the caches and the session
+    (for the badge) through ``sync_to_async``.
+    """
+
+    def decorator(view_func):
+        if iscoroutinefunction(view_func):
+
+            @wraps(view_func)
+            async def async_wrapper(request, *args, **kwargs):
+                if not _cacheable(request):
+                    return await view_func(request, *args, **kwargs)
+
+                key, entry, versions = await sync_to_async(_lookup)(view_func.__name__, tags, request, kwargs)
+                if entry is not None:
+                    return await sync_to_async(_serve)(request, entry)
+                try:
+                    response = await view_func(request, *args, **kwargs)
+                finally:
+                    request._store_defer_cart_badge = False
+                return await sync_to_async(_store)(request, key, versions, response)
+
+            return async_wrapper
+
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if not _cacheable(request):
+                return view_func(request, *args, **kwargs)
+
+            key, entry, versions = _lookup(view_func.__name__, tags, request, kwargs)
+            if entry is not None:
+                return _serve(request, entry)
+            try:
+                response = view_func(request, *args, **kwargs)
+            finally:
+                request._store_defer_cart_badge = False
+            return _store(request, key, versions, response)
+
+        return wrapper
+
+    return decorator
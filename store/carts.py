@@ -0,0 +1,535 @@
+"""
+store.carts
+-----------
+
+Cart mutations shared by the HTML views and the API.
+
+``apply_cart_operations`` runs a list of add/update/remove operations
+against one cart in a single transaction. The operations are first
+folded into one final change per instrument, then written with at most
+one DELETE, one multi-row insert and one ``bulk_update``. Adds to rows
+that already exist become ``F("quantity") + n`` so they compose with
+concurrent writers instead of overwriting them.
+
+``add_cart_items`` is the single way to add units to a cart. Reading the
+row, incrementing in Python and saving loses updates when two requests
+race, and two concurrent ``get_or_create`` calls trip the
+``(cart, instrument)`` unique constraint. Instead the add is one
+statement, ``INSERT ... ON CONFLICT (cart_id, instrument_id) DO UPDATE
+SET quantity = quantity + excluded.quantity``, on backends that support
+it (SQLite, PostgreSQL), and an ``F()`` update with an insert-and-retry
+fallback elsewhere.
+
+With ``STORE_CART_STORAGE = "cookie"``, visitors without a session keep
+their cart in a signed cookie instead (`CookieCart`), so anonymous
+browsing and cart changes need no session or cart rows at all. The
+first request that needs a persistent cart (checkout, any mutation once
+the visitor has a session, or a change to a cart already holding
+``STORE_CART_COOKIE_MAX_LINES`` lines) merges the cookie into a ``Cart``
+row.
+
+Every mutation bumps ``Cart.updated_at`` (see `touch_cart`), which is
+what ``purge_carts`` uses to find abandoned carts. Purging walks the
+cart table in primary-key windows and deletes each window's matches in
+its own short transaction, so no lock is held for long.
+"""
+
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, connection, transaction
+from django.db.models import Exists, F, OuterRef, Q
+from django.utils import timezone
+
+from .models import Cart, CartItem, Instrument
+
+logger = logging.getLogger(__name__)
+
+CART_COOKIE_NAME = "store_cart"
+_CART_COOKIE_SALT = "store.carts.cookie"
+
+CART_OPERATIONS = ("add", "update", "remove")
+
+
+class CartOperationError(ValueError):
+    """Raised for an invalid operation; `index` is its position in the batch."""
+
+    def __init__(self, index, message):
+        super().__init__(message)
+        self.index = index
+
+
+@dataclass
+class CartOperation:
+    """One parsed batch operation; exactly one of `slug`/`item_id` is set."""
+
+    op: str
+    slug: str = None
+    item_id: int = None
+    quantity: int = None
+
+
+def parse_cart_operations(data, limit):
+    """Validate raw operation dicts (e.g. from a JSON body).
+
+    Returns a list of `CartOperation`; raises `CartOperationError` for
+    the first invalid entry.
+    """
+
+    if not isinstance(data, list) or not data:
+        raise CartOperationError(None, "Expected a non-empty list of operations")
+    if len(data) > limit:
+        raise CartOperationError(None, f"At most {limit} operations per batch")
+
+    operations = []
+    for index, raw in enumerate(data):
+        if not isinstance(raw, dict):
+            raise CartOperationError(index, "Operation must be an object")
+        op = raw.get("op")
+        if op not in CART_OPERATIONS:
+            raise CartOperationError(index, f"Unknown op; expected one of {', '.join(CART_OPERATIONS)}")
+
+        slug, item_id = raw.get("slug"), raw.get("item_id")
+        if bool(slug) == (item_id is not None):
+            raise CartOperationError(index, "Provide exactly one of slug or item_id")
+        if item_id is not None:
+            try:
+                item_id = int(item_id)
+            except (TypeError, ValueError):
+                raise CartOperationError(index, "Invalid item_id")
+        if op == "add" and item_id is not None:
+            raise CartOperationError(index, "add takes a slug")
+
+        quantity = None
+        if op != "remove":
+            try:
+                quantity = int(raw.get("quantity", 1 if op == "add" else None))
+            except (TypeError, ValueError):
+                raise CartOperationError(index, "Invalid quantity")
+            if op == "add" and quantity <= 0:
+                raise CartOperationError(index, "Quantity must be greater than 0")
+
+        operations.append(CartOperation(op, slug=slug, item_id=item_id, quantity=quantity))
+    return operations
+
+
+def cookie_carts_enabled():
+    return getattr(settings, "STORE_CART_STORAGE", "session") == "cookie"
+
+
+class CartLines(list):
+    """Cart lines that also answer ``.all()``, like the `items` manager."""
+
+    def all(self):
+        return self
+
+
+class CookieCart:
+    """A visitor's cart held in a signed cookie as ``instrument_id:qty`` pairs.
+
+    Offers the parts of the `Cart` interface used by templates and
+    `CartSerializer`. Its lines are unsaved `CartItem` objects whose id
+    is the instrument id, so the item update/remove URLs work unchanged.
+    Changes are written back by ``store.middleware.CookieCartMiddleware``.
+    """
+
+    id = pk = None
+    session_key = ""
+    created_at = updated_at = None
+
+    def __init__(self, lines=None):
+        self.lines = dict(lines or {})
+        self.modified = False
+        self._instruments = {}
+
+    @classmethod
+    def from_request(cls, request):
+        """Return the request's cookie cart, decoding the cookie once."""
+
+        # Keep it on the Django request even when given a DRF `Request`
+        request = getattr(request, "_request", request)
+        cart = getattr(request, "_store_cookie_cart", None)
+        if cart is None:
+            cart = request._store_cookie_cart = cls(cls.decode(request.get_signed_cookie(CART_COOKIE_NAME, "", salt=_CART_COOKIE_SALT)))
+        return cart
+
+    @staticmethod
+    def decode(value):
+        lines = {}
+        for pair in value.split(","):
+            try:
+                instrument_id, quantity = (int(part) for part in pair.split(":"))
+            except ValueError:
+                continue
+            if quantity > 0:
+                lines[instrument_id] = quantity
+        return lines
+
+    @property
+    def full(self):
+        """Whether the next change should move the cart into the database."""
+
+        return len(self.lines) >= getattr(settings, "STORE_CART_COOKIE_MAX_LINES", 20)
+
+    def encode(self):
+        return ",".join(f"{instrument_id}:{quantity}" for instrument_id, quantity in self.lines.items())
+
+    def write(self, response):
+        """Store the lines on `response` if they changed."""
+
+        if not self.modified:
+            return
+        if self.lines:
+            response.set_signed_cookie(
+                CART_COOKIE_NAME,
+                self.encode(),
+                salt=_CART_COOKIE_SALT,
+                max_age=getattr(settings, "STORE_CART_COOKIE_AGE", 1209600),
+                httponly=True,
+                samesite="Lax",
+            )
+        else:
+            response.delete_cookie(CART_COOKIE_NAME, samesite="Lax")
+
+    def add(self, quantities):
+        for instrument_id, amount in quantities.items():
+            self.lines[instrument_id] = self.lines.get(instrument_id, 0) + amount
+        self.modified = True
+
+    def set(self, instrument_id, quantity):
+        if instrument_id not in self.lines:
+            return False
+        if quantity > 0:
+            self.lines[instrument_id] = quantity
+        else:
+            del self.lines[instrument_id]
+        self.modified = True
+        return True
+
+    def clear(self):
+        if self.lines:
+            self.lines = {}
+            self.modified = True
+
+    @property
+    def items(self):
+        missing = self.lines.keys() - self._instruments.keys()
+        if missing:
+            self._instruments.update(Instrument.objects.select_related("category").in_bulk(missing))
+        return CartLines(
+            CartItem(pk=instrument_id, instrument=self._instruments[instrument_id], quantity=quantity)
+            for instrument_id, quantity in self.lines.items()
+            if instrument_id in self._instruments
+        )
+
+    def get_totals(self):
+        items = self.items
+        return sum(item.quantity for item in items), sum(item.get_subtotal() for item in items)
+
+    def get_total(self):
+        return self.get_totals()[1]
+
+    def get_item_count(self):
+        # Read from the cookie alone so the cart badge needs no queries
+        return sum(self.lines.values())
+
+
+def touch_cart(cart_id):
+    """Record activity on a cart so the purge treats it as live."""
+
+    Cart.objects.filter(pk=cart_id).update(updated_at=timezone.now())
+
+
+def _upsert_cart_items(cart, quantities):
+    table = connection.ops.quote_name(CartItem._meta.db_table)
+    cart_id, instrument_id, quantity, added_at = (
+        connection.ops.quote_name(CartItem._meta.get_field(name).column) for name in ("cart", "instrument", "quantity", "added_at")
+    )
+    now = timezone.now()
+    values = ", ".join(["(%s, %s, %s, %s)"] * len(quantities))
+    params = []
+    for instrument, amount in quantities.items():
+        params.extend([cart.pk, instrument, amount, now])
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} ({cart_id}, {instrument_id}, {quantity}, {added_at}) VALUES {values} "
+            f"ON CONFLICT ({cart_id}, {instrument_id}) DO UPDATE SET {quantity} = {table}.{quantity} + excluded.{quantity}",
+            params,
+        )
+
+
+def _increment_cart_item(cart, instrument_id, amount):
+    updated = CartItem.objects.filter(cart=cart, instrument_id=instrument_id).update(quantity=F("quantity") + amount)
+    if updated:
+        return
+    try:
+        with transaction.atomic():
+            CartItem.objects.create(cart=cart, instrument_id=instrument_id, quantity=amount)
+    except IntegrityError:
+        # A concurrent request inserted the row first; add on top of it
+        CartItem.objects.filter(cart=cart, instrument_id=instrument_id).update(quantity=F("quantity") + amount)
+
+
+def add_cart_items(cart, quantities, touch=True):
+    """Atomically add units to `cart`.
+
+    `quantities` maps instrument ids to the (positive) number of units
+    to add; missing rows are created. Safe under concurrent requests.
+    Pass `touch=False` for a cart created in this request, whose
+    `updated_at` is already current.
+    """
+
+    if not quantities:
+        return
+    if isinstance(cart, CookieCart):
+        cart.add(quantities)
+        return
+    if connection.features.supports_update_conflicts_with_target:
+        _upsert_cart_items(cart, quantities)
+    else:
+        for instrument_id, amount in quantities.items():
+            _increment_cart_item(cart, instrument_id, amount)
+    if touch:
+        touch_cart(cart.pk)
+
+
+def set_cart_item_quantity(cart, item_id, quantity):
+    """Set the quantity of one line of `cart`, removing it when `quantity` <= 0.
+
+    Returns False when `item_id` is not a line of this cart.
+    """
+
+    if isinstance(cart, CookieCart):
+        return cart.set(item_id, quantity)
+    if cart.pk is None:
+        return False
+    items = CartItem.objects.filter(cart=cart, pk=item_id)
+    changed = items.delete()[0] if quantity <= 0 else items.update(quantity=quantity)
+    if changed:
+        touch_cart(cart.pk)
+    return bool(changed)
+
+
+def merge_cookie_cart(request, cart, quantities=None, touch=True):
+    """Move the visitor's cookie cart lines into the database `cart`.
+
+    `quantities` (instrument id -> units) are added in the same upsert;
+    `touch` is passed on to `add_cart_items`.
+    """
+
+    quantities = dict(quantities or {})
+    cookie_cart = CookieCart.from_request(request)
+    if cookie_cart.lines:
+        existing = set(Instrument.objects.filter(pk__in=cookie_cart.lines).values_list("pk", flat=True))
+        for pk, quantity in cookie_cart.lines.items():
+            if pk in existing:
+                quantities[pk] = quantities.get(pk, 0) + quantity
+        cookie_cart.clear()
+    add_cart_items(cart, quantities, touch=touch)
+
+
+def _fold(operations, instrument_ids):
+    """Reduce operations to one final change per instrument id.
+
+    A change is ``("increment", n)`` relative to the stored quantity,
+    ``("set", n)`` or ``("delete", None)``.
+    """
+
+    changes = {}
+    for index, operation in enumerate(operations):
+        instrument_id = instrument_ids[index]
+        kind, amount = changes.get(instrument_id, ("increment", 0))
+        if operation.op == "add":
+            if kind == "delete":
+                kind, amount = "set", 0
+            changes[instrument_id] = (kind, amount + operation.quantity)
+        elif operation.op == "update" and operation.quantity > 0:
+            changes[instrument_id] = ("set", operation.quantity)
+        else:
+            changes[instrument_id] = ("delete", None)
+    return changes
+
+
+def apply_cart_operations(cart, operations, writable_cart=None):
+    """Apply parsed `operations` to `cart` atomically and return the cart changed.
+
+    Raises `CartOperationError` (and writes nothing) when an operation
+    names an unknown instrument or an item outside this cart. `cart` may
+    be the read-only cart of `get_cart`: once every operation is valid,
+    `writable_cart()` is called for the cart to change (creating the
+    session and `Cart` row if needed), so a rejected batch creates
+    nothing; a cookie cart is changed first and moves into a `Cart` row
+    once it is full. Adds of instruments not yet in the cart go through
+    `add_cart_items`, so a row inserted concurrently is incremented
+    rather than duplicated.
+    """
+
+    slugs = {operation.slug for operation in operations if operation.slug}
+
+    with transaction.atomic():
+        instruments = dict(Instrument.objects.filter(slug__in=slugs).values_list("slug", "id")) if slugs else {}
+        existing = _locked_items(cart)
+        if isinstance(cart, CookieCart):
+            # Cookie cart lines are addressed by instrument id
+            by_item_id = {instrument_id: instrument_id for instrument_id in cart.lines}
+        else:
+            by_item_id = {item.id: item.instrument_id for item in existing.values()}
+
+        instrument_ids = []
+        for index, operation in enumerate(operations):
+            if operation.slug:
+                if operation.slug not in instruments:
+                    raise CartOperationError(index, f"Unknown instrument {operation.slug!r}")
+                instrument_ids.append(instruments[operation.slug])
+            else:
+                if operation.item_id not in by_item_id:
+                    raise CartOperationError(index, f"Item {operation.item_id} is not in this cart")
+                instrument_ids.append(by_item_id[operation.item_id])
+        changes = _fold(operations, instrument_ids)
+
+        if isinstance(cart, CookieCart):
+            _apply_cookie_cart_changes(cart, changes)
+            # A cookie cart grown past its limit moves into a `Cart` row here
+            return writable_cart() if writable_cart is not None else cart
+        if writable_cart is not None and cart.pk is None:
+            cart = writable_cart()
+            existing = _locked_items(cart)
+
+        to_delete, to_create, to_update = [], {}, []
+        for instrument_id, (kind, amount) in changes.items():
+            item = existing.get(instrument_id)
+            if kind == "delete":
+                if item is not None:
+                    to_delete.append(item.pk)
+            elif item is None:
+                if amount > 0:
+                    to_create[instrument_id] = amount
+            elif kind == "increment":
+                if amount:
+                    item.quantity = F("quantity") + amount
+                    to_update.append(item)
+            elif amount > 0:
+                item.quantity = amount
+                to_update.append(item)
+            else:
+                to_delete.append(item.pk)
+
+        if to_delete:
+            CartItem.objects.filter(pk__in=to_delete).delete()
+        if to_update:
+            CartItem.objects.bulk_update(to_update, ["quantity"])
+        if to_create:
+            add_cart_items(cart, to_create)
+        else:
+            touch_cart(cart.pk)
+    return cart
+
+
+def _locked_items(cart):
+    """Lines of a database `cart` by instrument id, locked until the transaction ends."""
+
+    if isinstance(cart, CookieCart) or cart.pk is None:
+        return {}
+    return {item.instrument_id: item for item in CartItem.objects.select_for_update().filter(cart=cart)}
+
+
+def _apply_cookie_cart_changes(cart, changes):
+    for instrument_id, (kind, amount) in changes.items():
+        if kind == "increment":
+            amount += cart.lines.get(instrument_id, 0)
+        cart.lines.pop(instrument_id, None)
+        if kind != "delete" and amount > 0:
+            cart.lines[instrument_id] = amount
+    cart.modified = True
+
+
+@dataclass
+class PurgeResult:
+    carts: int = 0
+    items: int = 0
+    batches: int = 0
+    seconds: float = 0.0
+
+
+def purge_carts(stale_before, empty_before, batch_size=1000, dry_run=False):
+    """Delete carts idle since `stale_before`, and empty ones idle since `empty_before`.
+
+    Works through the primary-key range `batch_size` ids at a time, one
+    short transaction per window. Returns a `PurgeResult`.
+    """
+
+    started = time.monotonic()
+    result = PurgeResult()
+    expired = Q(updated_at__lt=stale_before) | Q(updated_at__lt=empty_before, has_items=False)
+    candidates = Cart.objects.annotate(has_items=Exists(CartItem.objects.filter(cart=OuterRef("pk")))).filter(expired)
+
+    bounds = Cart.objects.filter(updated_at__lt=max(stale_before, empty_before)).order_by("pk").values_list("pk", flat=True)
+    low, high = bounds.first(), bounds.last()
+    while low is not None and low <= high:
+        window = candidates.filter(pk__gte=low, pk__lt=low + batch_size)
+        with transaction.atomic():
+            if dry_run:
+                ids = list(window.values_list("pk", flat=True))
+                result.carts += len(ids)
+                result.items += CartItem.objects.filter(cart_id__in=ids).count() if ids else 0
+            elif any(window.select_for_update().values_list("pk", flat=True)):
+                # Lock the window's carts (where supported), then delete
+                # through the filter again, so a cart that got an item or
+                # was touched since it was selected is kept. Items have no
+                # delete signals, so this is two fast DELETEs.
+                _, deleted = window.delete()
+                result.carts += deleted.get(Cart._meta.label, 0)
+                result.items += deleted.get(CartItem._meta.label, 0)
+        result.batches += 1
+        low += batch_size
+
+    result.seconds = time.monotonic() - started
+    return result
+
+
+def purge_expired_carts(batch_size=None, dry_run=False):
+    """Run `purge_carts` with the ages configured in settings."""
+
+    now = timezone.now()
+    return purge_carts(
+        stale_before=now - timedelta(days=getattr(settings, "STORE_CART_MAX_AGE_DAYS", 30)),
+        empty_before=now - timedelta(hours=getattr(settings, "STORE_EMPTY_CART_MAX_AGE_HOURS", 24)),
+        batch_size=batch_size or getattr(settings, "STORE_CART_PURGE_BATCH_SIZE", 1000),
+        dry_run=dry_run,
+    )
+
+
+_scheduler = None
+
+
+def start_purge_scheduler(interval):
+    """Run `purge_expired_carts` every `interval` seconds in a daemon thread.
+
+    Meant for single-host deployments without cron; safe to start in
+    several workers since the purge is idempotent. Starts at most once
+    per process.
+    """
+
+    global _scheduler
+    if _scheduler is not None:
+        return _scheduler
+
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                result = purge_expired_carts()
+                logger.info("Purged %d carts and %d items in %.2fs", result.carts, result.items, result.seconds)
+            except Exception:
+                logger.exception("Cart purge failed")
+            finally:
+                close_old_connections()
+
+    _scheduler = threading.Thread(target=run, name="store-cart-purge", daemon=True)
+    _scheduler.start()
+    return _scheduler
@@ -0,0 +1,206 @@
+"""
+store.catalog
+-------------
+
+Process-wide snapshot of the catalog's reference data.
+
+Nearly every page shows the categories and brand filters, which change
+perhaps once a month. ``catalog_snapshot()`` returns an immutable
+``CatalogSnapshot`` shared by all threads of a process, so views and
+serializers read this data without queries:
+
+- the categories as ``CategoryRef`` objects (compact, read-only,
+  ``__slots__``) in ``Category`` ordering, indexed by slug and id
+- ``FacetCounts`` for each category and for the whole catalog (see
+  ``store.facets``)
+- the instrument condition choices
+
+A snapshot takes two queries to build (categories and the
+``InstrumentFacet`` table) and is replaced as a whole, so readers never
+see half an update. Its version is the ``catalog`` tag token in the
+shared cache tier (see ``store.cache``):
+
+- Category and facet changes call ``invalidate_catalog`` (from
+  ``store.signals`` and ``rebuild_facets``). It drops this process'
+  snapshot at once and replaces the token when the transaction commits.
+- Every process compares its snapshot's version with the token at most
+  once every ``STORE_CATALOG_SNAPSHOT_TTL`` seconds (0, the default,
+  checks on every access: a shared-cache read, no query). With a TTL,
+  other processes may render, and cache, pages from the old snapshot for
+  up to that long.
+
+A snapshot built inside a transaction may include that transaction's
+uncommitted writes, so it is only served to the same connection while
+the transaction is open; everyone else rebuilds.
+"""
+
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from .cache import invalidate_tags, tag_versions
+from .facets import FacetCounts, build_facet_counts
+from .models import Category, Instrument, InstrumentFacet
+from .querybudget import unbudgeted
+
+CATALOG_TAG = "catalog"
+
+
+class _ReadOnly:
+    __slots__ = ()
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is read-only")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is read-only")
+
+
+class CategoryRef(_ReadOnly):
+    """A category row; renders and serializes like a ``Category``."""
+
+    __slots__ = ("id", "name", "slug", "description")
+
+    @property
+    def pk(self):
+        return self.id
+
+    def __str__(self):
+        return self.name
+
+    def __repr__(self):
+        return f"<CategoryRef: {self.slug}>"
+
+
+class CatalogSnapshot(_ReadOnly):
+    """Categories, facet counts and condition choices at one catalog version."""
+
+    __slots__ = ("version", "categories", "conditions", "_by_slug", "_by_id", "_facets", "_atomic_blocks")
+
+    def category(self, slug):
+        """The `CategoryRef` with `slug`, or None."""
+
+        return self._by_slug.get(slug)
+
+    def category_by_id(self, category_id):
+        return self._by_id.get(category_id)
+
+    def facets(self, category_slug=None):
+        """`FacetCounts` for a category slug, or the whole catalog."""
+
+        return self._facets.get(category_slug, _NO_FACETS)
+
+    def visible_to(self, connection):
+        # Built outside a transaction, or inside one `connection` is still in
+        blocks = self._atomic_blocks
+        if blocks is None:
+            return True
+        current = connection.atomic_blocks
+        return len(current) >= len(blocks) and all(a is b for a, b in zip(current, blocks))
+
+
+_NO_FACETS = FacetCounts()
+
+
+def build_snapshot(version=None, using=DEFAULT_DB_ALIAS):
+    """Read a new `CatalogSnapshot` from the database."""
+
+    categories = tuple(CategoryRef(*row) for row in Category.objects.using(using).values_list(*CategoryRef.__slots__))
+    by_id = {category.id: category for category in categories}
+
+    rows = {None: {}}
+    facets = InstrumentFacet.objects.using(using).filter(count__gt=0).values_list("category_id", "facet", "value", "count")
+    for category_id, facet, value, count in facets:
+        category = by_id.get(category_id)
+        if category is not None:
+            rows.setdefault(category.slug, {})[facet, value] = count
+        totals = rows[None]
+        totals[facet, value] = totals.get((facet, value), 0) + count
+
+    connection = connections[using]
+    return CatalogSnapshot(
+        version,
+        categories,
+        tuple(Instrument.CONDITION_CHOICES),
+        {category.slug: category for category in categories},
+        by_id,
+        {slug: build_facet_counts((facet, value, count) for (facet, value), count in counts.items()) for slug, counts in rows.items()},
+        tuple(connection.atomic_blocks) if connection.in_atomic_block else None,
+    )
+
+
+class _SnapshotHolder:
+    """The current snapshot of one process. Reads never lock; rebuilds swap it in."""
+
+    def __init__(self, ttl=0):
+        self.ttl = ttl
+        self._snapshot = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def _due(self):
+        return self._checked_at is None or time.monotonic() - self._checked_at >= self.ttl
+
+    def peek(self):
+        """The snapshot if it can be served without I/O, else None."""
+
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot._atomic_blocks is None and not self._due():
+            return snapshot
+        return None
+
+    def get(self, using=DEFAULT_DB_ALIAS):
+        connection = connections[using]
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.visible_to(connection) and not self._due():
+            return snapshot
+
+        version = tag_versions([CATALOG_TAG])[CATALOG_TAG]
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None or snapshot.version != version or not snapshot.visible_to(connection):
+                with unbudgeted():
+                    snapshot = build_snapshot(version, using)
+                self._snapshot = snapshot
+            self._checked_at = time.monotonic()
+        return snapshot
+
+    def clear(self):
+        self._snapshot = None
+
+
+_holder = _SnapshotHolder(getattr(settings, "STORE_CATALOG_SNAPSHOT_TTL", 0))
+
+
+def catalog_snapshot(using=DEFAULT_DB_ALIAS):
+    """Return the current `CatalogSnapshot`, rebuilding it if the catalog changed."""
+
+    return _holder.get(using)
+
+
+async def acatalog_snapshot(using=DEFAULT_DB_ALIAS):
+    """Async version of `catalog_snapshot`."""
+
+    snapshot = _holder.peek()
+    if snapshot is None:
+        snapshot = await sync_to_async(_holder.get)(using)
+    return snapshot
+
+
+def invalidate_catalog(using=DEFAULT_DB_ALIAS):
+    """Rebuild the snapshot in this process now, and in every process after commit."""
+
+    _holder.clear()
+
+    def committed():
+        invalidate_tags(CATALOG_TAG)
+        _holder.clear()
+
+    transaction.on_commit(committed, using=using)
@@ -0,0 +1,94 @@
+"""
+store.conditional
+-----------------
+
+ETag / Last-Modified validators for the read-only catalog API.
+
+Clients polling the catalog mostly get back what they already have.
+These helpers derive a cheap catalog version for a request without
+serializing anything, so Django's ``condition`` decorator can answer
+``If-None-Match`` / ``If-Modified-Since`` with a 304:
+
+- instrument lists: ``Max(updated_at)`` and ``Count`` over the filtered rows
+- an instrument: its id and ``updated_at``
+- categories: the ``categories`` invalidation tag kept by ``store.cache``
+
+Each is combined with the request host and normalized query string,
+since those also shape the response body (absolute URLs, pagination),
+and with the ``categories`` tag, since category names are serialized too.
+
+Only the instrument detail sends Last-Modified. A list's newest
+``updated_at`` stays the same when rows are deleted or leave the filter,
+so lists are validated by ETag alone.
+"""
+
+import hashlib
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.db.models import Count, Max
+from django.views.decorators.http import condition
+
+from .cache import tag_versions
+
+
+def _etag(request, *parts):
+    query = "&".join(f"{key}={value}" for key, values in sorted(request.GET.lists()) for value in sorted(values))
+    raw = "|".join([request.get_host(), request.path, query, *(str(part) for part in parts)])
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _memoized(request, key, compute):
+    # condition() asks for the ETag and Last-Modified separately
+    cache = request.__dict__.setdefault("_store_validators", {})
+    if key not in cache:
+        cache[key] = compute()
+    return cache[key]
+
+
+def catalog_condition(state_func):
+    """Wrap a view with ETag/Last-Modified validation.
+
+    `state_func(request, *args, **kwargs)` returns ``(version, last_modified)``
+    for the data the view would serialize, or ``None`` when there is
+    nothing to validate (e.g. the view will 404).
+    """
+
+    def state(request, *args, **kwargs):
+        return _memoized(request, "state", lambda: state_func(request, *args, **kwargs))
+
+    def etag_func(request, *args, **kwargs):
+        def compute():
+            current = state(request, *args, **kwargs)
+            if current is None:
+                return None
+            return _etag(request, current[0], tag_versions(["categories"])["categories"])
+
+        return _memoized(request, "etag", compute)
+
+    def last_modified_func(request, *args, **kwargs):
+        current = state(request, *args, **kwargs)
+        return current[1] if current else None
+
+    def decorator(view_func):
+        conditional = condition(etag_func=etag_func, last_modified_func=last_modified_func)(view_func)
+        if not iscoroutinefunction(view_func):
+            return conditional
+
+        @wraps(view_func)
+        async def async_wrapper(request, *args, **kwargs):
+            # condition() calls the validators synchronously; run the
+            # queries (and the tag lookup) first so it only sees memos
+            await sync_to_async(etag_func)(request, *args, **kwargs)
+            return await conditional(request, *args, **kwargs)
+
+        return async_wrapper
+
+    return decorator
+
+
+def queryset_state(queryset):
+    """Return ``(version, None)`` for an instrument queryset; lists send no Last-Modified."""
+
+    totals = queryset.order_by().aggregate(last_modified=Max("updated_at"), count=Count("id"))
+    return f"{totals['last_modified']}:{totals['count']}", None
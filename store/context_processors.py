@@ -1,15 +1,35 @@
-from .models import Cart
+from .cache import CART_BADGE_PLACEHOLDER
+from .carts import CookieCart, cookie_carts_enabled
+from .views import CART_COUNT_SESSION_KEY, cart_item_count
+
+
+def cart_badge_count(request):
+    """Return the cart badge count for the current visitor.
+
+    The count is cached in the session by the cart views (see
+    `store.views.remember_cart_count`), so rendering the badge needs no
+    cart queries. Visitors without a session never touch the database;
+    their count comes from the cookie cart, if enabled.
+    """
+
+    session = request.session
+    if not session.session_key:
+        if cookie_carts_enabled():
+            return CookieCart.from_request(request).get_item_count()
+        return 0
+
+    count = session.get(CART_COUNT_SESSION_KEY)
+    if count is None:
+        # Session predates the cached count; compute it once and keep it
+        count = session[CART_COUNT_SESSION_KEY] = cart_item_count(session.session_key)
+    return count
 
 
 def cart_context(request):
     """Add cart item count to all templates"""
-    cart_item_count = 0
 
-    if request.session.session_key:
-        try:
-            cart = Cart.objects.get(session_key=request.session.session_key)
-            cart_item_count = cart.get_item_count()
-        except Cart.DoesNotExist:
-            pass
+    if getattr(request, "_store_defer_cart_badge", False):
+        # Page is headed for the shared cache; the count is filled in per request
+        return {"cart_item_count": CART_BADGE_PLACEHOLDER}
 
-    return {"cart_item_count": cart_item_count}
+    return {"cart_item_count": cart_badge_count(request)}
@@ -0,0 +1,70 @@
+"""
+store.export
+------------
+
+Streaming catalog export for downstream feeds.
+
+Building ``InstrumentSerializer(...).data`` for the whole catalog keeps
+every row, model instance and serializer field in memory at once. The
+export instead walks the catalog with ``.iterator()`` over flat
+``values()`` rows (category columns joined in the same query) and turns
+each row into a dict with ``InstrumentRowSerializer``, the fast path
+that matches ``InstrumentSerializer`` output exactly. Peak memory is
+bounded by ``EXPORT_CHUNK_SIZE`` rows whatever the catalog size.
+
+Used by the ``/api/instruments/export.ndjson`` endpoint and the
+``export_catalog`` management command.
+"""
+
+import json
+
+from .serializers import InstrumentRowSerializer
+
+EXPORT_CHUNK_SIZE = 2000
+
+
+def export_rows(queryset, absolute=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield API-shaped dicts for every instrument in `queryset`, in id order.
+
+    `absolute` optionally turns site-relative image URLs into absolute
+    ones (e.g. ``request.build_absolute_uri``).
+    """
+
+    serializer = InstrumentRowSerializer(absolute=absolute)
+    rows = queryset.order_by("id").values(*InstrumentRowSerializer.columns)
+    for row in rows.iterator(chunk_size=chunk_size):
+        yield serializer.to_representation(row)
+
+
+async def aexport_rows(queryset, absolute=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """Async version of `export_rows`."""
+
+    serializer = InstrumentRowSerializer(absolute=absolute)
+    rows = queryset.order_by("id").values(*InstrumentRowSerializer.columns)
+    async for row in rows.aiterator(chunk_size=chunk_size):
+        yield serializer.to_representation(row)
+
+
+def ndjson_lines(rows):
+    """Encode dicts as newline-delimited JSON."""
+
+    for row in rows:
+        yield json.dumps(row, ensure_ascii=False) + "\n"
+
+
+async def andjson_lines(rows):
+    """Async version of `ndjson_lines`."""
+
+    async for row in rows:
+        yield json.dumps(row, ensure_ascii=False) + "\n"
+
+
+def json_array_chunks(rows):
+    """Encode dicts as one JSON array, streamed element by element."""
+
+    yield "["
+    separator = ""
+    for row in rows:
+        yield separator + json.dumps(row, ensure_ascii=False)
+        separator = ","
+    yield "]\n"
@@ -0,0 +1,162 @@
+"""
+store.facets
+------------
+
+Precomputed facet counts for the category filter controls.
+
+Category pages show brand, condition (new/used) and deal filters. Rather
+than running DISTINCT/COUNT queries over ``Instrument`` on every request,
+per-category counts of in-stock instruments are kept in the
+``InstrumentFacet`` table and adjusted incrementally whenever an
+instrument is saved or deleted (see ``store.signals``). Views read the
+counts from the process-wide catalog snapshot (``store.catalog``).
+
+Writes that bypass model signals (``bulk_create``, ``QuerySet.update``)
+should be followed by ``rebuild_facets()``.
+"""
+
+from collections import Counter
+from dataclasses import dataclass
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+
+from .models import Instrument, InstrumentFacet
+
+# Fields whose previous values are needed to compute a facet delta
+STATE_FIELDS = ("category_id", "brand", "condition", "featured", "in_stock")
+
+
+@dataclass(frozen=True)
+class FacetCounts:
+    """Facet counts for one category (or the whole catalog).
+
+    - `brands`: ``(brand, count)`` tuples ordered by brand name
+    - `new` / `used`: instrument counts per condition bucket
+    - `deals`: number of instruments flagged as deals (`featured`)
+    """
+
+    brands: tuple = ()
+    new: int = 0
+    used: int = 0
+    deals: int = 0
+
+    @property
+    def brand_names(self):
+        return [brand for brand, _ in self.brands]
+
+
+def condition_bucket(condition):
+    """Map an instrument condition to the new/used bucket used by filters."""
+
+    return "new" if condition == "new" else "used"
+
+
+def facet_values(category_id, brand, condition, featured, in_stock):
+    """Return the ``(category_id, facet, value)`` keys counted for an instrument."""
+
+    if not in_stock or category_id is None:
+        return []
+
+    keys = [
+        (category_id, "brand", brand),
+        (category_id, "condition", condition_bucket(condition)),
+    ]
+    if featured:
+        keys.append((category_id, "deal", "1"))
+    return keys
+
+
+def _state(values):
+    return tuple(values[name] for name in STATE_FIELDS)
+
+
+def _instance_state(instrument):
+    return tuple(getattr(instrument, name) for name in STATE_FIELDS)
+
+
+def _apply(delta):
+    """Apply a ``{(category_id, facet, value): change}`` mapping to the table."""
+
+    with transaction.atomic():
+        for (category_id, facet, value), change in delta.items():
+            if not change:
+                continue
+            rows = InstrumentFacet.objects.filter(category_id=category_id, facet=facet, value=value)
+            if rows.update(count=F("count") + change) or change < 0:
+                continue
+            try:
+                with transaction.atomic():
+                    InstrumentFacet.objects.create(category_id=category_id, facet=facet, value=value, count=change)
+            except IntegrityError:
+                # Another writer created the row first; increment theirs
+                rows.update(count=F("count") + change)
+
+
+def instrument_saved(instrument, previous=None):
+    """Move an instrument's contribution from its previous to its current facets.
+
+    `previous` maps `STATE_FIELDS` to the values stored before the save,
+    or is None for a new instrument. Returns whether any count changed.
+    """
+
+    delta = Counter()
+    if previous is not None:
+        delta.subtract(facet_values(*_state(previous)))
+    delta.update(facet_values(*_instance_state(instrument)))
+    _apply(delta)
+    return any(delta.values())
+
+
+def instrument_deleted(instrument):
+    """Remove a deleted instrument's contribution from the facet table.
+
+    Returns whether any count changed.
+    """
+
+    delta = Counter()
+    delta.subtract(facet_values(*_instance_state(instrument)))
+    _apply(delta)
+    return any(delta.values())
+
+
+def rebuild_facets():
+    """Recompute every facet count from the ``Instrument`` table."""
+
+    in_stock = Instrument.objects.filter(in_stock=True)
+    rows = []
+    for item in in_stock.values("category_id", "brand").annotate(n=Count("id")):
+        rows.append(InstrumentFacet(category_id=item["category_id"], facet="brand", value=item["brand"], count=item["n"]))
+
+    conditions = Counter()
+    for item in in_stock.values("category_id", "condition").annotate(n=Count("id")):
+        conditions[(item["category_id"], condition_bucket(item["condition"]))] += item["n"]
+    for (category_id, bucket), count in conditions.items():
+        rows.append(InstrumentFacet(category_id=category_id, facet="condition", value=bucket, count=count))
+
+    for item in in_stock.filter(featured=True).values("category_id").annotate(n=Count("id")):
+        rows.append(InstrumentFacet(category_id=item["category_id"], facet="deal", value="1", count=item["n"]))
+
+    from .catalog import invalidate_catalog
+
+    with transaction.atomic():
+        InstrumentFacet.objects.all().delete()
+        InstrumentFacet.objects.bulk_create(rows)
+        invalidate_catalog()
+
+
+def build_facet_counts(rows):
+    """Return `FacetCounts` from ``(facet, value, count)`` rows."""
+
+    brands = []
+    counts = {}
+    for facet, value, count in rows:
+        if count <= 0:
+            continue
+        if facet == "brand":
+            brands.append((value, count))
+        elif facet == "condition":
+            counts[value] = count
+        elif facet == "deal":
+            counts["deals"] = count
+    return FacetCounts(brands=tuple(sorted(brands)), **counts)
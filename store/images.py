@@ -0,0 +1,312 @@
+"""
+store.images
+------------
+
+Resolution of instrument image URLs without per-access storage calls.
+
+Instrument images can live in two places: uploaded files under
+``MEDIA_ROOT/instruments`` and the seed images shipped in
+``static/instruments``. Deciding which one to serve used to cost a
+``storage.exists`` call (a filesystem ``stat``) for every card in every
+listing. Instead, ``ImageManifest`` keeps a process-wide snapshot of the
+file names in each directory:
+
+- the media manifest re-lists its directory only when the directory's
+  mtime changes, and checks the mtime at most once every
+  ``STORE_IMAGE_MANIFEST_TTL`` seconds;
+- the static manifest is read once, since static files only change on
+  deploy.
+
+Saving an ``Instrument`` with an image refreshes the media manifest in
+that process (see ``store.signals``), so new uploads do not wait for
+the TTL.
+
+Responsive derivatives
+~~~~~~~~~~~~~~~~~~~~~~
+
+Card grids display images a couple of hundred pixels wide, so every
+image also gets resized copies (``STORE_IMAGE_WIDTHS``) in WebP and JPEG
+under ``MEDIA_ROOT/instruments/derivatives``, named after the full source
+file name (``strat.jpg-320w.webp``). They are generated on a background
+thread once a transaction that saves an instrument image commits, and
+backfilled by ``manage.py build_image_derivatives``; templates and the
+API expose them as ``srcset`` strings through ``image_srcsets``.
+Derivatives older than their source file are rendered again. Writing
+new derivatives bumps the instruments' ``updated_at`` and invalidates
+their cached pages, so no page or ETag keeps an empty ``srcset``.
+"""
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.templatetags.static import static
+
+logger = logging.getLogger(__name__)
+
+PLACEHOLDER_IMAGE = "instruments/placeholder.svg"
+DERIVATIVES_DIRECTORY = "instruments/derivatives"
+
+# Output formats for derivatives: format -> (file extension, Pillow save options)
+DERIVATIVE_FORMATS = {
+    "webp": ("webp", {"format": "WEBP", "quality": 80, "method": 4}),
+    "jpeg": ("jpg", {"format": "JPEG", "quality": 82, "optimize": True, "progressive": True}),
+}
+
+
+class ImageManifest:
+    """Snapshot of the file names in one directory, refreshed on change.
+
+    Names are stored relative to `root` (e.g. ``"instruments/x.jpg"``) to
+    match ``FieldFile.name``. Lookups never lock: refreshes swap in a new
+    frozenset. A `ttl` of None means the directory is listed only once.
+    """
+
+    def __init__(self, root, subdirectory, ttl=None):
+        self.root = str(root)
+        self.subdirectory = subdirectory
+        self.ttl = ttl
+        self._names = frozenset()
+        self._mtime = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def directory(self):
+        return os.path.join(self.root, self.subdirectory)
+
+    def _stale(self):
+        if self._checked_at is None:
+            return True
+        if self.ttl is None:
+            return False
+        return time.monotonic() - self._checked_at >= self.ttl
+
+    def refresh(self, force=False):
+        """Re-list the directory if its mtime changed (or when forced)."""
+
+        with self._lock:
+            self._checked_at = time.monotonic()
+            try:
+                mtime = os.stat(self.directory).st_mtime_ns
+            except OSError:
+                self._names, self._mtime = frozenset(), None
+                return
+            if force or mtime != self._mtime:
+                with os.scandir(self.directory) as entries:
+                    self._names = frozenset(f"{self.subdirectory}/{entry.name}" for entry in entries if entry.is_file())
+                self._mtime = mtime
+
+    def __contains__(self, name):
+        if self._stale():
+            self.refresh()
+        return name in self._names
+
+
+media_manifest = ImageManifest(settings.MEDIA_ROOT, "instruments", ttl=getattr(settings, "STORE_IMAGE_MANIFEST_TTL", 5))
+static_manifest = ImageManifest(settings.BASE_DIR / "static", "instruments")
+
+
+def resolve_image_url(name):
+    """Return the URL to serve for a stored instrument image name.
+
+    Prefers the uploaded media file, then a static seed image with the
+    same name, then the placeholder. `name` is the `ImageField` value
+    (``FieldFile.name``), empty when the instrument has no image.
+    """
+
+    if not name:
+        return static(PLACEHOLDER_IMAGE)
+    if name in media_manifest:
+        return default_storage.url(name)
+    if name in static_manifest:
+        return static(name)
+    return static(PLACEHOLDER_IMAGE)
+
+
+derivative_manifest = ImageManifest(settings.MEDIA_ROOT, DERIVATIVES_DIRECTORY, ttl=getattr(settings, "STORE_IMAGE_MANIFEST_TTL", 5))
+
+
+def derivative_widths():
+    return tuple(getattr(settings, "STORE_IMAGE_WIDTHS", (320, 640, 960)))
+
+
+def derivative_name(image_name, width, fmt):
+    """Return the media-relative name of one derivative of `image_name`.
+
+    The source extension is kept, so ``strat.jpg`` and ``strat.png`` get
+    separate derivatives.
+    """
+
+    return f"{DERIVATIVES_DIRECTORY}/{os.path.basename(image_name)}-{width}w.{DERIVATIVE_FORMATS[fmt][0]}"
+
+
+def source_path(image_name):
+    """Return the filesystem path of the original image, or None."""
+
+    if image_name in media_manifest:
+        return os.path.join(str(settings.MEDIA_ROOT), image_name)
+    if image_name in static_manifest:
+        return os.path.join(str(settings.BASE_DIR / "static"), image_name)
+    return None
+
+
+def _is_current(path, source_mtime):
+    try:
+        return os.stat(path).st_mtime_ns >= source_mtime
+    except OSError:
+        return False
+
+
+def render_derivatives(source, image_name, media_root, widths, force=False):
+    """Write the missing or outdated copies of one image; return how many were written.
+
+    Depends only on its arguments (no Django state), so it can run in
+    worker processes. A copy is outdated when it is older than `source`.
+    Images are never upscaled: widths at or above the original width are
+    skipped.
+    """
+
+    from PIL import Image, ImageOps
+
+    source_mtime = os.stat(source).st_mtime_ns
+    targets = []
+    for width in widths:
+        for fmt in DERIVATIVE_FORMATS:
+            path = os.path.join(media_root, derivative_name(image_name, width, fmt))
+            if force or not _is_current(path, source_mtime):
+                targets.append((width, fmt, path))
+    if not targets:
+        return 0
+
+    written = 0
+    with Image.open(source) as original:
+        original = ImageOps.exif_transpose(original)
+        if original.mode not in ("RGB", "RGBA"):
+            has_alpha = "A" in original.getbands() or "transparency" in original.info
+            original = original.convert("RGBA" if has_alpha else "RGB")
+        for width, fmt, path in targets:
+            if width >= original.width:
+                continue
+            height = round(original.height * width / original.width)
+            resized = original.resize((width, height), Image.LANCZOS)
+            if fmt == "jpeg" and resized.mode == "RGBA":
+                background = Image.new("RGB", resized.size, "white")
+                background.paste(resized, mask=resized.getchannel("A"))
+                resized = background
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            _, options = DERIVATIVE_FORMATS[fmt]
+            # Write to a temporary name so readers never see partial files
+            tmp_path = f"{path}.tmp"
+            resized.save(tmp_path, **options)
+            os.replace(tmp_path, path)
+            written += 1
+    return written
+
+
+def generate_derivatives(image_name, force=False):
+    """Generate missing or outdated derivatives for one stored image name."""
+
+    source = source_path(image_name)
+    if source is None:
+        return 0
+    written = render_derivatives(source, image_name, str(settings.MEDIA_ROOT), derivative_widths(), force=force)
+    if written:
+        derivative_manifest.refresh()
+        publish_derivatives(image_name)
+    return written
+
+
+def publish_derivatives(*image_names, batch_size=500):
+    """Make new derivatives of `image_names` visible to cached pages and conditional GETs.
+
+    Bumps ``updated_at`` of the instruments using the images (the API's
+    validators are built from it) and invalidates their cached pages.
+    """
+
+    from django.utils import timezone
+
+    from .cache import invalidate_tags
+    from .models import Instrument
+
+    tags = set()
+    now = timezone.now()
+    for start in range(0, len(image_names), batch_size):
+        instruments = Instrument.objects.filter(image__in=image_names[start : start + batch_size])
+        for slug, category_slug in instruments.values_list("slug", "category__slug"):
+            tags.update({f"instrument:{slug}", f"category:{category_slug}"})
+        instruments.update(updated_at=now)
+    if tags:
+        invalidate_tags("instruments", *sorted(tags))
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=settings.STORE_IMAGE_DERIVATIVE_WORKERS, thread_name_prefix="store-images")
+    return _executor
+
+
+def _generate_logged(image_name):
+    try:
+        generate_derivatives(image_name)
+    except OSError as e:
+        # Unreadable image; `build_image_derivatives` reports these too
+        logger.warning("Could not render derivatives of %s: %s", image_name, e)
+
+
+def _generate_in_background(image_name):
+    try:
+        _generate_logged(image_name)
+    finally:
+        # The pool thread is outside the request cycle that would close its connection
+        close_old_connections()
+
+
+def schedule_derivatives(image_name, using=None):
+    """Generate the derivatives of `image_name` after the current transaction commits.
+
+    Resizing takes a noticeable fraction of a second per image, so it
+    runs on ``STORE_IMAGE_DERIVATIVE_WORKERS`` background threads instead
+    of the saving request; with 0 workers it runs in the committing thread.
+    """
+
+    def committed():
+        if settings.STORE_IMAGE_DERIVATIVE_WORKERS:
+            _get_executor().submit(_generate_in_background, image_name)
+        else:
+            _generate_logged(image_name)
+
+    transaction.on_commit(committed, using=using)
+
+
+def image_srcsets(name):
+    """Return ``{"webp": srcset, "jpeg": srcset}`` for a stored image name.
+
+    Only derivatives present on disk are listed; formats without any
+    derivative map to an empty string.
+    """
+
+    srcsets = {fmt: "" for fmt in DERIVATIVE_FORMATS}
+    if not name:
+        return srcsets
+
+    for fmt in DERIVATIVE_FORMATS:
+        candidates = []
+        for width in derivative_widths():
+            derivative = derivative_name(name, width, fmt)
+            if derivative in derivative_manifest:
+                candidates.append(f"{default_storage.url(derivative)} {width}w")
+        srcsets[fmt] = ", ".join(candidates)
+    return srcsets
@@ -0,0 +1,93 @@
+"""
+Management command to compare a page's reads run in sequence with the
+same reads run together by `store.batching.fetch_together`.
+Usage: python manage.py benchmark_batching [--repeat 50] [--search guitar] [--latency-ms 2]
+
+On SQLite the reads only overlap with spare CPU cores; --latency-ms adds
+a simulated network round-trip to every query, as a PostgreSQL server on
+another host would.
+"""
+
+import statistics
+import time
+from contextlib import ExitStack
+from functools import partial
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.test import RequestFactory
+
+from store import views
+from store.batching import _evaluate, fetch_together
+from store.models import Instrument
+from store.search import search_instruments
+
+
+class Command(BaseCommand):
+    help = "Benchmark sequential reads against store.batching.fetch_together"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=50, help="Timed runs per page and mode")
+        parser.add_argument("--search", default="guitar", help="Search term for the product list reads")
+        parser.add_argument("--latency-ms", type=float, default=0, help="Simulated round-trip time added to every query")
+
+    def handle(self, *args, **options):
+        if not settings.STORE_QUERY_BATCH_WORKERS:
+            raise CommandError("STORE_QUERY_BATCH_WORKERS is 0, so fetch_together runs reads in sequence")
+        if not Instrument.objects.exists():
+            raise CommandError("The catalog is empty; run load_initial_data or generate_catalog first")
+
+        factory = RequestFactory()
+        amps_effects = views.AMPS_EFFECTS_PAGE.queryset()
+        search = search_instruments(Instrument.objects.select_related("category").filter(in_stock=True), options["search"])
+        pages = {
+            # The reads `_category_context` and `product_list` run together
+            "amps & effects": (
+                partial(views._paginate, factory.get("/amps-effects/"), amps_effects),
+                partial(views._brand_facets, amps_effects),
+            ),
+            "product list search": (
+                partial(views._paginate, factory.get("/products/"), search),
+                search.count,
+            ),
+        }
+
+        opened = []
+        latency = options["latency_ms"] / 1000
+
+        def round_trip(execute, sql, params, many, context):
+            time.sleep(latency)
+            return execute(sql, params, many, context)
+
+        def count_connection(sender, connection, **kwargs):
+            opened.append(connection.alias)
+
+        connection_created.connect(count_connection)
+        # fetch_together installs the caller's execute wrappers on its pool threads
+        stack = ExitStack()
+        if latency:
+            stack.enter_context(connection.execute_wrapper(round_trip))
+        try:
+            # Untimed, so pool threads have connected before measuring
+            fetch_together(*pages["amps & effects"])
+            for name, reads in pages.items():
+                results = {}
+                for label, run in (("sequential", lambda: [_evaluate(read) for read in reads]), ("fetch_together", lambda: fetch_together(*reads))):
+                    timings = []
+                    opened.clear()
+                    for _ in range(options["repeat"]):
+                        start = time.perf_counter()
+                        run()
+                        timings.append(time.perf_counter() - start)
+                    results[label] = statistics.median(timings)
+                    self.stdout.write(
+                        f"{name:<20} {label:<15} median {results[label] * 1000:8.2f} ms  "
+                        f"({len(opened)} connections opened in {options['repeat']} runs)"
+                    )
+                sequential, together = results.values()
+                self.stdout.write(self.style.SUCCESS(f"✓ {name}: fetch_together {sequential / together:.2f}x the speed of sequential reads"))
+        finally:
+            stack.close()
+            connection_created.disconnect(count_connection)
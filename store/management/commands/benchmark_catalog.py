@@ -0,0 +1,94 @@
+"""
+Management command to benchmark every store route and save the results.
+Usage: python manage.py benchmark_catalog [--users 4] [--rounds 20] [--output bench.json] [--compare old.json]
+"""
+
+import json
+import subprocess
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+
+from store.benchmark import SCENARIOS, run_benchmark, uncovered_routes
+from store.models import Cart, Instrument
+
+
+class Command(BaseCommand):
+    help = "Measure p50/p95/p99 latency and query counts for every route in store.urls"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=4, help="Concurrent virtual users (threads)")
+        parser.add_argument("--rounds", type=int, default=20, help="Timed passes over all routes per user")
+        parser.add_argument("--warmup", type=int, default=1, help="Untimed passes before measuring")
+        parser.add_argument("--route", action="append", dest="routes", choices=sorted(SCENARIOS), help="Only these routes (repeatable)")
+        parser.add_argument("--no-page-cache", action="store_true", help="Disable the catalog page cache for the run")
+        parser.add_argument("--seed", type=int, default=0, help="Seed for the per-user request order")
+        parser.add_argument("--output", "-o", default="benchmark.json", help="Where to write the JSON results")
+        parser.add_argument("--compare", help="Earlier results file to compare against")
+
+    def handle(self, *args, **options):
+        for option in ("users", "rounds"):
+            if options[option] < 1:
+                raise CommandError(f"--{option} must be at least 1")
+        if options["warmup"] < 0:
+            raise CommandError("--warmup must not be negative")
+        missing = uncovered_routes()
+        if missing:
+            raise CommandError(f"No benchmark scenario for: {', '.join(missing)} (add them to store.benchmark.SCENARIOS)")
+
+        page_cache = settings.STORE_PAGE_CACHE_ENABLED and not options["no_page_cache"]
+        with override_settings(STORE_PAGE_CACHE_ENABLED=page_cache):
+            try:
+                summary = run_benchmark(options["routes"], users=options["users"], rounds=options["rounds"], warmup=options["warmup"], seed=options["seed"])
+            except ValueError as error:
+                raise CommandError(str(error))
+
+        results = {
+            "meta": {
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "commit": self.git_commit(),
+                "database": connection.vendor,
+                "instruments": Instrument.objects.count(),
+                "carts": Cart.objects.count(),
+                "users": options["users"],
+                "rounds": options["rounds"],
+                "page_cache": page_cache,
+                "cart_storage": getattr(settings, "STORE_CART_STORAGE", "session"),
+            },
+            **summary,
+        }
+        with open(options["output"], "w", encoding="utf-8") as out:
+            json.dump(results, out, indent=2, sort_keys=True)
+
+        baseline = None
+        if options["compare"]:
+            with open(options["compare"], encoding="utf-8") as existing:
+                baseline = json.load(existing)["routes"]
+        self.report(summary["routes"], baseline)
+        self.stdout.write(
+            self.style.SUCCESS(f"✓ {summary['requests_per_second']} req/s over {summary['wall_seconds']}s; results written to {options['output']}")
+        )
+
+    @staticmethod
+    def git_commit():
+        try:
+            return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True, cwd=settings.BASE_DIR).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def report(self, routes, baseline=None):
+        self.stdout.write(f"{'route':<24} {'p50':>8} {'p95':>8} {'p99':>8} {'queries':>8}" + ("   p95 vs baseline" if baseline else ""))
+        for name, result in sorted(routes.items()):
+            if not result["requests"]:
+                self.stdout.write(f"{name:<24} {'no samples':>8}")
+                continue
+            line = f"{name:<24} {result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f} {result['p99_ms']:>8.2f} {result['queries_max']:>8}"
+            previous = (baseline or {}).get(name)
+            if previous and previous["requests"]:
+                change = (result["p95_ms"] - previous["p95_ms"]) / previous["p95_ms"] * 100 if previous["p95_ms"] else 0
+                queries = result["queries_max"] - previous["queries_max"]
+                line += f"   {change:+6.1f}%  {queries:+d} queries"
+            self.stdout.write(line)
@@ -0,0 +1,54 @@
+"""
+Management command to compare the DRF instrument serializer with the
+fast row serializer on the current catalog.
+Usage: python manage.py benchmark_serializers [--limit 200] [--repeat 20]
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from store.models import Instrument
+from store.serializers import InstrumentRowSerializer, InstrumentSerializer
+
+
+class Command(BaseCommand):
+    help = "Benchmark InstrumentSerializer against InstrumentRowSerializer"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=200, help="Instruments per serialized page")
+        parser.add_argument("--repeat", type=int, default=20, help="Timed runs per serializer")
+
+    def handle(self, *args, **options):
+        limit, repeat = options["limit"], options["repeat"]
+        request = APIRequestFactory().get("/api/instruments/", HTTP_HOST="localhost")
+        renderer = JSONRenderer()
+        instruments = Instrument.objects.select_related("category").order_by("id")[:limit]
+
+        def drf_path():
+            data = InstrumentSerializer(instruments.all(), many=True, context={"request": request}).data
+            return renderer.render(data)
+
+        def fast_path():
+            rows = InstrumentRowSerializer.rows(Instrument.objects.order_by("id"))[:limit]
+            return renderer.render(InstrumentRowSerializer(request).many(rows))
+
+        drf_output, fast_output = drf_path(), fast_path()
+        if drf_output != fast_output:
+            raise CommandError("Serializer outputs differ; fix InstrumentRowSerializer before benchmarking")
+
+        count = len(instruments)
+        results = {}
+        for label, func in (("DRF InstrumentSerializer", drf_path), ("InstrumentRowSerializer", fast_path)):
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                func()
+                timings.append(time.perf_counter() - start)
+            results[label] = min(timings)
+            self.stdout.write(f"{label:<26} best {min(timings) * 1000:8.2f} ms  ({count} instruments, {repeat} runs)")
+
+        drf_time, fast_time = results.values()
+        self.stdout.write(self.style.SUCCESS(f"✓ Identical output ({len(fast_output)} bytes), {drf_time / fast_time:.1f}x faster"))
@@ -0,0 +1,60 @@
+"""
+Management command to backfill responsive image derivatives.
+Usage: python manage.py build_image_derivatives [--workers N] [--force]
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from store.images import derivative_manifest, derivative_widths, publish_derivatives, render_derivatives, source_path
+from store.models import Instrument
+
+
+class Command(BaseCommand):
+    help = "Generate resized WebP/JPEG copies of every instrument image"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Number of worker processes (default: CPU count)",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Regenerate derivatives that already exist",
+        )
+
+    def handle(self, *args, **options):
+        names = set(Instrument.objects.exclude(image="").exclude(image__isnull=True).values_list("image", flat=True))
+        jobs = []
+        for name in sorted(names):
+            source = source_path(name)
+            if source is None:
+                self.stdout.write(self.style.WARNING(f"⚠ No source file for {name}"))
+                continue
+            jobs.append((source, name))
+
+        media_root = str(settings.MEDIA_ROOT)
+        widths = derivative_widths()
+        written = 0
+        published = []
+        with ProcessPoolExecutor(max_workers=max(1, options["workers"])) as executor:
+            futures = {executor.submit(render_derivatives, source, name, media_root, widths, options["force"]): name for source, name in jobs}
+            for future in as_completed(futures):
+                try:
+                    count = future.result()
+                except Exception as e:
+                    self.stdout.write(self.style.ERROR(f"✗ {futures[future]}: {e}"))
+                    continue
+                written += count
+                if count:
+                    published.append(futures[future])
+
+        derivative_manifest.refresh(force=True)
+        publish_derivatives(*published)
+        self.stdout.write(self.style.SUCCESS(f"✓ Wrote {written} derivatives for {len(jobs)} images"))
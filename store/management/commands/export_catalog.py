@@ -0,0 +1,55 @@
+"""
+Management command to export the instrument catalog as NDJSON or JSON.
+Usage: python manage.py export_catalog [--format ndjson|json] [--output PATH]
+"""
+
+from django.core.management.base import BaseCommand
+
+from store.export import EXPORT_CHUNK_SIZE, export_rows, json_array_chunks, ndjson_lines
+from store.models import Instrument
+
+
+class Command(BaseCommand):
+    help = "Stream the instrument catalog to a file in API format"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", "-f", choices=("ndjson", "json"), default="ndjson", help="Output format")
+        parser.add_argument("--output", "-o", default="-", help="Output path ('-' for stdout)")
+        parser.add_argument(
+            "--base-url",
+            "-b",
+            default="",
+            help="Optional base URL to prefix to image URLs (e.g. https://example.com)",
+        )
+        parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE, help="Rows fetched per database round trip")
+        parser.add_argument("--all", action="store_true", help="Include out-of-stock instruments")
+
+    def handle(self, *args, **options):
+        base_url = options["base_url"].rstrip("/")
+        absolute = (lambda url: base_url + url if url.startswith("/") else url) if base_url else None
+
+        instruments = Instrument.objects.all()
+        if not options["all"]:
+            instruments = instruments.filter(in_stock=True)
+
+        rows = export_rows(instruments, absolute=absolute, chunk_size=options["chunk_size"])
+        encode = ndjson_lines if options["format"] == "ndjson" else json_array_chunks
+
+        out_path = options["output"]
+        if out_path == "-":
+            for chunk in encode(rows):
+                self.stdout.write(chunk, ending="")
+            return
+
+        count = 0
+
+        def counted(rows):
+            nonlocal count
+            for row in rows:
+                count += 1
+                yield row
+
+        with open(out_path, "w", encoding="utf-8") as out:
+            for chunk in encode(counted(rows)):
+                out.write(chunk)
+        self.stdout.write(self.style.SUCCESS(f"✓ Exported {count} instruments to {out_path}"))
@@ -0,0 +1,115 @@
+"""
+Management command to fill the database with a large synthetic catalog.
+Usage: python manage.py generate_catalog --instruments 100000 --carts 5000
+"""
+
+import random
+import secrets
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from store.cache import invalidate_tags
+from store.facets import rebuild_facets
+from store.models import Cart, CartItem, Category, Instrument
+from store.search import get_search_backend
+
+# category slug -> (name, brands, model words)
+CATALOG = {
+    "guitars": ("Guitars", ["Fender", "Gibson", "Ibanez", "PRS", "Martin", "Taylor", "Epiphone", "Gretsch"], ["Stratocaster", "Les Paul", "Dreadnought", "Telecaster", "SG", "Jazzmaster", "Hollowbody"]),
+    "bass-guitars": ("Bass Guitars", ["Fender", "Ibanez", "Music Man", "Warwick", "Yamaha"], ["Precision Bass", "Jazz Bass", "StingRay", "5-String Bass", "Short Scale Bass"]),
+    "drums": ("Drums", ["Pearl", "Ludwig", "DW", "Tama", "Zildjian", "Roland"], ["Drum Kit", "Snare Drum", "Ride Cymbal", "Electronic Kit", "Hi-Hat Pair"]),
+    "keyboards": ("Keyboards", ["Yamaha", "Roland", "Korg", "Nord", "Casio", "Kawai"], ["Stage Piano", "Synthesizer", "Digital Piano", "Workstation", "MIDI Controller"]),
+    "wind-instruments": ("Wind Instruments", ["Yamaha", "Selmer", "Bach", "Jupiter", "Buffet"], ["Alto Saxophone", "Tenor Saxophone", "Trumpet", "Flute", "Clarinet"]),
+    "string-instruments": ("String Instruments", ["Yamaha", "Stentor", "Eastman", "Cremona"], ["Violin", "Viola", "Cello", "Double Bass"]),
+}
+FINISHES = ["Sunburst", "Black", "Natural", "Cherry", "Olympic White", "Vintage", "Custom", "Deluxe", "Standard", "Pro"]
+# Weights for the values of Instrument.CONDITION_CHOICES
+CONDITIONS = [("new", 70), ("used_excellent", 12), ("used_good", 10), ("used_fair", 8)]
+
+
+class Command(BaseCommand):
+    help = "Generate a large synthetic catalog (instruments and carts) with bulk inserts"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--instruments", type=int, default=10000, help="Instruments to create")
+        parser.add_argument("--carts", type=int, default=0, help="Carts (with 1-6 items each) to create")
+        parser.add_argument("--chunk-size", type=int, default=5000, help="Rows per bulk_create")
+        parser.add_argument("--seed", type=int, default=None, help="Random seed for repeatable catalogs")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        chunk_size = options["chunk_size"]
+        started = time.monotonic()
+
+        categories = {}
+        for slug, (name, _, _) in CATALOG.items():
+            categories[slug], _ = Category.objects.get_or_create(slug=slug, defaults={"name": name, "description": f"{name} of every kind"})
+
+        # Unique per run so repeated runs add to the catalog instead of colliding
+        run = secrets.token_hex(3)
+        created = 0
+        while created < options["instruments"]:
+            count = min(chunk_size, options["instruments"] - created)
+            with transaction.atomic():
+                Instrument.objects.bulk_create(self.instrument(rng, categories, run, created + index) for index in range(count))
+            created += count
+            self.stdout.write(f"  {created:,} / {options['instruments']:,} instruments", ending="\r")
+        self.stdout.write("")
+
+        carts = self.create_carts(rng, options["carts"], chunk_size)
+
+        # bulk_create bypasses the signals that keep derived data in sync
+        self.stdout.write("Rebuilding search index and facet counts...")
+        get_search_backend().rebuild()
+        rebuild_facets()
+        invalidate_tags("instruments", "categories", *(f"category:{slug}" for slug in categories))
+
+        self.stdout.write(
+            self.style.SUCCESS(f"✓ Generated {created:,} instruments and {carts:,} carts in {time.monotonic() - started:.1f}s")
+        )
+
+    @staticmethod
+    def instrument(rng, categories, run, index):
+        slug = rng.choice(list(CATALOG))
+        _, brands, models = CATALOG[slug]
+        brand = rng.choice(brands)
+        name = f"{rng.choice(FINISHES)} {rng.choice(models)}"
+        condition = rng.choices([value for value, _ in CONDITIONS], weights=[weight for _, weight in CONDITIONS])[0]
+        price = Decimal(rng.randint(9_900, 450_000)) / 100
+        if condition != "new":
+            price = (price * Decimal("0.7")).quantize(Decimal("0.01"))
+        return Instrument(
+            name=name,
+            slug=f"{brand}-{name}-{run}-{index}".lower().replace(" ", "-"),
+            category=categories[slug],
+            brand=brand,
+            condition=condition,
+            price=price,
+            rating=Decimal(rng.randint(30, 50)) / 10,
+            description=f"{brand} {name}, condition: {dict(Instrument.CONDITION_CHOICES)[condition]}.",
+            specifications=f"Model year: {rng.randint(1995, 2025)}",
+            in_stock=rng.random() < 0.85,
+            featured=rng.random() < 0.03,
+        )
+
+    def create_carts(self, rng, count, chunk_size):
+        if not count:
+            return 0
+        instrument_ids = list(Instrument.objects.filter(in_stock=True).values_list("pk", flat=True))
+        created = 0
+        while created < count:
+            size = min(chunk_size, count - created)
+            with transaction.atomic():
+                carts = Cart.objects.bulk_create(Cart(session_key=secrets.token_hex(16)) for _ in range(size))
+                items = []
+                for cart in carts:
+                    for instrument_id in rng.sample(instrument_ids, min(len(instrument_ids), rng.randint(1, 6))):
+                        items.append(CartItem(cart=cart, instrument_id=instrument_id, quantity=rng.choice((1, 1, 1, 2, 3))))
+                CartItem.objects.bulk_create(items, batch_size=chunk_size)
+            created += size
+            self.stdout.write(f"  {created:,} / {count:,} carts", ending="\r")
+        self.stdout.write("")
+        return created
@@ -3,13 +3,14 @@ Management command to load initial data fixtures for deployment.
 Usage: python manage.py load_initial_data
 """
 
-import io
+import hashlib
+import json
 import os
-import random
+import shutil
 import textwrap
+from concurrent.futures import ProcessPoolExecutor
 
 from django.conf import settings
-from django.core.files.base import ContentFile
 from django.core.management import call_command
 from django.core.management.base import BaseCommand
 
@@ -62,76 +63,191 @@ class Command(BaseCommand):
         ensure_instrument_images(self.stdout)
 
 
-def ensure_instrument_images(stdout):
-    """Generate placeholder images for instruments missing media files."""
+PLACEHOLDER_PALETTE = [
+    "#1f2937",
+    "#374151",
+    "#4338ca",
+    "#7c3aed",
+    "#0f766e",
+    "#0369a1",
+]
+
+# Records the content hash behind every image this command wrote, so
+# later runs can tell generated files that are current from stale ones
+# (and from files uploaded through the admin, which are never touched).
+MANIFEST_NAME = ".ensure_images_manifest.json"
+
+
+def _file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _placeholder_hash(title, subtitle):
+    return hashlib.sha256(f"placeholder:v1:{title}\0{subtitle}".encode()).hexdigest()
+
+
+def _link_or_copy(source, target):
+    """Hardlink `source` to `target`, falling back to a streaming copy."""
+
+    tmp_target = f"{target}.tmp"
+    if os.path.exists(tmp_target):
+        os.remove(tmp_target)
+    try:
+        os.link(source, tmp_target)
+    except OSError:
+        shutil.copyfile(source, tmp_target)
+    os.replace(tmp_target, target)
+
+
+def render_placeholder(path, title, subtitle):
+    """Render an 800x800 placeholder JPEG to `path`.
+
+    Module-level and free of Django state so it can run in worker
+    processes. The background colour is derived from the title, making
+    the output deterministic.
+    """
+
+    font = ImageFont.load_default()
+    color = PLACEHOLDER_PALETTE[int(hashlib.md5(title.encode()).hexdigest(), 16) % len(PLACEHOLDER_PALETTE)]
+    image = Image.new("RGB", (800, 800), color)
+    draw = ImageDraw.Draw(image)
+
+    text_lines = textwrap.wrap(title, width=20)
+    y = 320
+    for line in text_lines:
+        bbox = draw.textbbox((0, 0), line, font=font)
+        width = bbox[2] - bbox[0]
+        height = bbox[3] - bbox[1]
+        draw.text(((800 - width) / 2, y), line, fill="white", font=font)
+        y += height + 6
+
+    subtitle_bbox = draw.textbbox((0, 0), subtitle, font=font)
+    subtitle_width = subtitle_bbox[2] - subtitle_bbox[0]
+    draw.text(((800 - subtitle_width) / 2, 520), subtitle, fill="#cbd5f5", font=font)
+
+    tmp_path = f"{path}.tmp"
+    image.save(tmp_path, format="JPEG", quality=85)
+    os.replace(tmp_path, path)
+
+
+def ensure_instrument_images(stdout, workers=None):
+    """Make sure every instrument has an image file under MEDIA_ROOT.
+
+    - Static seed images are hardlinked (or stream-copied) into media.
+    - Instruments without a usable image get a rendered placeholder;
+      rendering runs in a process pool.
+    - Files whose source hash matches the manifest are skipped, and
+      files not written by this command (uploads) are left alone.
+    - Every file written gets its responsive derivatives re-rendered
+      in the same pool (see `store.images`).
+    - Changed image names are written with a single `bulk_update`, and
+      every instrument with new images gets a new `updated_at` and
+      invalidated cached pages (see `store.images.publish_derivatives`).
+    """
+
+    from store.images import derivative_manifest, derivative_widths, media_manifest, publish_derivatives, render_derivatives
     from store.models import Instrument
 
     media_path = os.path.join(settings.MEDIA_ROOT, "instruments")
     static_path = os.path.join(settings.BASE_DIR, "static", "instruments")
     os.makedirs(media_path, exist_ok=True)
 
-    palette = [
-        "#1f2937",
-        "#374151",
-        "#4338ca",
-        "#7c3aed",
-        "#0f766e",
-        "#0369a1",
-    ]
-
-    font = ImageFont.load_default()
-
     def write_success(message: str) -> None:
         if hasattr(stdout, "style"):
             stdout.write(stdout.style.SUCCESS(message))
         else:
             stdout.write(f"{message}\n")
 
-    for instrument in Instrument.objects.all():
-        file_exists = False
+    manifest_path = os.path.join(media_path, MANIFEST_NAME)
+    try:
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+
+    media_manifest.refresh(force=True)
+    static_hashes = {}
+    copies = []
+    placeholders = []
+    changed = []
+
+    for instrument in Instrument.objects.only("id", "slug", "name", "brand", "image", "category_id").iterator(chunk_size=2000):
         image_name = instrument.image.name if instrument.image and instrument.image.name else ""
+        file_exists = bool(image_name) and image_name in media_manifest
 
         if image_name:
-            try:
-                file_exists = instrument.image.storage.exists(image_name)
-            except Exception:
-                file_exists = False
-
-        if not file_exists and image_name:
             static_candidate = os.path.join(static_path, os.path.basename(image_name))
             if os.path.exists(static_candidate):
-                with open(static_candidate, "rb") as f:
-                    instrument.image.save(os.path.basename(image_name), ContentFile(f.read()), save=True)
-                write_success(f"✓ Copied static image for {instrument.name}")
+                if static_candidate not in static_hashes:
+                    static_hashes[static_candidate] = _file_hash(static_candidate)
+                digest = static_hashes[static_candidate]
+                if not file_exists or manifest.get(image_name) not in (None, digest):
+                    copies.append((static_candidate, image_name, digest))
                 continue
 
-        if file_exists:
+        if file_exists and manifest.get(image_name) is None:
+            # Uploaded or otherwise externally managed file
             continue
 
         title = instrument.name or "Instrument"
         subtitle = instrument.brand or "Dave's Music"
+        digest = _placeholder_hash(title, subtitle)
         slug = instrument.slug or f"instrument-{instrument.pk}"
-        filename = f"{slug}.jpg"
-
-        image = Image.new("RGB", (800, 800), random.choice(palette))
-        draw = ImageDraw.Draw(image)
-
-        text_lines = textwrap.wrap(title, width=20)
-        y = 320
-        for line in text_lines:
-            bbox = draw.textbbox((0, 0), line, font=font)
-            width = bbox[2] - bbox[0]
-            height = bbox[3] - bbox[1]
-            draw.text(((800 - width) / 2, y), line, fill="white", font=font)
-            y += height + 6
-
-        subtitle_bbox = draw.textbbox((0, 0), subtitle, font=font)
-        subtitle_width = subtitle_bbox[2] - subtitle_bbox[0]
-        draw.text(((800 - subtitle_width) / 2, 520), subtitle, fill="#cbd5f5", font=font)
-
-        buffer = io.BytesIO()
-        image.save(buffer, format="JPEG", quality=85)
-        buffer.seek(0)
-
-        instrument.image.save(filename, ContentFile(buffer.getvalue()), save=True)
-        write_success(f"✓ Created placeholder image for {instrument.name}")
+        name = f"instruments/{slug}.jpg"
+        if image_name == name and file_exists and manifest.get(name) == digest:
+            continue
+
+        placeholders.append((name, title, subtitle, digest))
+        if image_name != name:
+            instrument.image.name = name
+            changed.append(instrument)
+
+    for source, image_name, digest in copies:
+        _link_or_copy(source, os.path.join(settings.MEDIA_ROOT, image_name))
+        manifest[image_name] = digest
+    if copies:
+        write_success(f"✓ Linked {len(copies)} static images into media")
+
+    written = sorted({image_name for _, image_name, _ in copies} | {name for name, _, _, _ in placeholders})
+    if written:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(render_placeholder, os.path.join(settings.MEDIA_ROOT, name), title, subtitle)
+                for name, title, subtitle, _ in placeholders
+            ]
+            for future in futures:
+                future.result()
+            for name, _, _, digest in placeholders:
+                manifest[name] = digest
+            if placeholders:
+                write_success(f"✓ Created {len(placeholders)} placeholder images")
+
+            # Linked copies keep their source's mtime, so force the re-render
+            media_root = str(settings.MEDIA_ROOT)
+            futures = [
+                executor.submit(render_derivatives, os.path.join(media_root, name), name, media_root, derivative_widths(), True)
+                for name in written
+            ]
+            derivatives = sum(future.result() for future in futures)
+        derivative_manifest.refresh(force=True)
+        write_success(f"✓ Rendered {derivatives} image derivatives")
+
+    if changed:
+        Instrument.objects.bulk_update(changed, ["image"], batch_size=500)
+    if written:
+        # bulk_update bypasses signals and auto_now; this sets updated_at
+        # and invalidates cached pages of every instrument with new images
+        publish_derivatives(*written)
+
+    if copies or placeholders:
+        tmp_manifest = f"{manifest_path}.tmp"
+        with open(tmp_manifest, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=0, sort_keys=True)
+        os.replace(tmp_manifest, manifest_path)
+        media_manifest.refresh(force=True)
+    else:
+        write_success("✓ Instrument images are up to date")
@@ -0,0 +1,37 @@
+"""
+Management command to delete abandoned carts in small batches.
+Usage: python manage.py purge_carts [--max-age-days 30] [--empty-age-hours 24] [--dry-run]
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from store.carts import purge_carts
+
+
+class Command(BaseCommand):
+    help = "Delete carts idle longer than the configured ages, in primary-key batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--max-age-days", type=int, default=settings.STORE_CART_MAX_AGE_DAYS, help="Delete any cart idle this many days")
+        parser.add_argument(
+            "--empty-age-hours", type=int, default=settings.STORE_EMPTY_CART_MAX_AGE_HOURS, help="Delete empty carts idle this many hours"
+        )
+        parser.add_argument("--batch-size", type=int, default=settings.STORE_CART_PURGE_BATCH_SIZE, help="Cart ids per delete transaction")
+        parser.add_argument("--dry-run", action="store_true", help="Count what would be deleted without deleting")
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        result = purge_carts(
+            stale_before=now - timedelta(days=options["max_age_days"]),
+            empty_before=now - timedelta(hours=options["empty_age_hours"]),
+            batch_size=options["batch_size"],
+            dry_run=options["dry_run"],
+        )
+        verb = "Would reclaim" if options["dry_run"] else "Reclaimed"
+        self.stdout.write(
+            self.style.SUCCESS(f"✓ {verb} {result.carts} carts and {result.items} cart items in {result.batches} batches ({result.seconds:.2f}s)")
+        )
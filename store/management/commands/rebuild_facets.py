@@ -0,0 +1,16 @@
+"""
+Management command to recompute the precomputed category facet counts.
+Usage: python manage.py rebuild_facets
+"""
+
+from django.core.management.base import BaseCommand
+
+from store.facets import rebuild_facets
+
+
+class Command(BaseCommand):
+    help = "Recompute per-category brand/condition/deal facet counts"
+
+    def handle(self, *args, **options):
+        rebuild_facets()
+        self.stdout.write(self.style.SUCCESS("✓ Facet counts rebuilt"))
@@ -0,0 +1,17 @@
+"""
+Management command to rebuild the instrument full-text search index.
+Usage: python manage.py rebuild_search_index
+"""
+
+from django.core.management.base import BaseCommand
+
+from store.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = "Rebuild the instrument full-text search index"
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        backend.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"✓ Search index rebuilt ({type(backend).__name__})"))
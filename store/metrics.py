@@ -0,0 +1,338 @@
+"""
+store.metrics
+-------------
+
+Per-view request metrics in Prometheus text format.
+
+``store.middleware.MetricsMiddleware`` measures every request and files the numbers
+under the resolved URL name (``home``, ``api_cart_add``,
+``admin:index``...):
+
+- latency (``store_request_duration_seconds``)
+- SQL queries and time in SQL, counted with ``connection.execute_wrapper``
+- with ``STORE_METRICS_TEMPLATE_TIMING``, template render time (outermost
+  ``Template.render`` calls; includes queries that templates evaluate
+  lazily)
+- response size (non-streaming responses only)
+- a request counter by method and status code
+
+Metrics are off unless ``STORE_METRICS_ENABLED`` is set. Recording is
+lock-free: each thread observes into its own histograms (``_Shard``) and
+readers merge the shards. When a thread ends, its shard is folded into
+the process totals and dropped, so thread churn doesn't grow the list.
+Every worker process writes its merged totals to ``STORE_METRICS_DIR``
+at most once per ``STORE_METRICS_FLUSH_INTERVAL`` seconds (from a
+thread, not the event loop, under ASGI), and ``/metrics`` sums the
+files of all workers, so the endpoint reports the same numbers whichever
+gunicorn worker serves it. Like Prometheus' own multiprocess mode, the
+directory should be emptied when the service is (re)deployed.
+
+Requests slower than ``STORE_SLOW_REQUEST_MS`` are logged to the
+``store.metrics`` logger together with their SQL (statements only;
+parameters are left out as they can carry session keys).
+"""
+
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+import weakref
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import asynccontextmanager, contextmanager
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (1_000, 5_000, 10_000, 50_000, 100_000, 500_000, 1_000_000, 5_000_000)
+
+# name -> (help text, bucket upper bounds)
+HISTOGRAMS = {
+    "store_request_duration_seconds": ("Request latency by view", DURATION_BUCKETS),
+    "store_request_sql_queries": ("SQL queries per request by view", QUERY_BUCKETS),
+    "store_request_sql_duration_seconds": ("Time spent in SQL per request by view", DURATION_BUCKETS),
+    "store_request_template_duration_seconds": ("Template render time per request by view", DURATION_BUCKETS),
+    "store_response_size_bytes": ("Response body size by view", SIZE_BUCKETS),
+}
+REQUESTS_TOTAL = "store_requests_total"
+
+# Statements kept per request for the slow-request log
+SLOW_LOG_MAX_QUERIES = 100
+
+UNRESOLVED_VIEW = "<unresolved>"
+
+
+class _Shard:
+    """One thread's histograms; only its owning thread writes to it."""
+
+    def __init__(self):
+        # (metric, view) -> [bucket counts..., +Inf count, sum]
+        self.histograms = {}
+        # (view, method, status) -> count
+        self.requests = defaultdict(int)
+
+    def observe(self, metric, view, value):
+        bounds = HISTOGRAMS[metric][1]
+        values = self.histograms.get((metric, view))
+        if values is None:
+            values = self.histograms[(metric, view)] = [0] * (len(bounds) + 2)
+        values[bisect_left(bounds, value)] += 1
+        values[-1] += value
+
+    def as_dict(self):
+        histograms = {}
+        for (metric, view), values in list(self.histograms.items()):
+            histograms.setdefault(metric, {})[view] = values[:]
+        requests = {"\t".join(map(str, key)): count for key, count in list(self.requests.items())}
+        return {"histograms": histograms, "requests": requests}
+
+
+class _ThreadToken:
+    """Held only by a thread's locals, so it is collected when the thread ends."""
+
+
+_shards = []
+# Totals of the shards of finished threads
+_retired = {"histograms": {}, "requests": {}}
+_shards_lock = threading.Lock()
+_local = threading.local()
+
+
+def _shard():
+    shard = getattr(_local, "shard", None)
+    if shard is None:
+        shard = _Shard()
+        token = _ThreadToken()
+        with _shards_lock:
+            _shards.append(shard)
+        weakref.finalize(token, _retire, shard)
+        _local.shard, _local.token = shard, token
+    return shard
+
+
+def _retire(shard):
+    global _retired
+
+    with _shards_lock:
+        _retired = merge_snapshots([_retired, shard.as_dict()])
+        _shards.remove(shard)
+
+
+def merge_snapshots(snapshots):
+    """Sum snapshots (see `snapshot`) of several threads or workers."""
+
+    histograms = {}
+    requests = defaultdict(int)
+    for data in snapshots:
+        for metric, views in data["histograms"].items():
+            for view, values in views.items():
+                merged = histograms.setdefault(metric, {}).setdefault(view, [0] * len(values))
+                for index, value in enumerate(values):
+                    merged[index] += value
+        for key, count in data["requests"].items():
+            requests[key] += count
+    return {"histograms": histograms, "requests": dict(requests)}
+
+
+def snapshot():
+    """This process's totals as a JSON-serializable dict."""
+
+    with _shards_lock:
+        return merge_snapshots([_retired, *(shard.as_dict() for shard in _shards)])
+
+
+# Worker files are keyed by pid plus a random token so a recycled pid
+# never overwrites a previous worker's totals
+_worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+_flush_lock = threading.Lock()
+_last_flush = 0.0
+
+
+def flush_due():
+    return time.monotonic() - _last_flush >= settings.STORE_METRICS_FLUSH_INTERVAL
+
+
+def flush(force=False):
+    """Write this worker's totals to ``STORE_METRICS_DIR`` (throttled unless `force`)."""
+
+    global _last_flush
+
+    if not force and not flush_due():
+        return
+    # Another thread flushing means the file is about to be current anyway
+    if not _flush_lock.acquire(blocking=force):
+        return
+    try:
+        _last_flush = time.monotonic()
+        directory = settings.STORE_METRICS_DIR
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"worker-{_worker_id}.json")
+        temporary = f"{path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as out:
+            json.dump(snapshot(), out)
+        os.replace(temporary, path)
+    except OSError:
+        logger.exception("Could not write request metrics")
+    finally:
+        _flush_lock.release()
+
+
+def collect():
+    """Totals of every worker that has written to ``STORE_METRICS_DIR``."""
+
+    flush(force=True)
+    snapshots = []
+    directory = settings.STORE_METRICS_DIR
+    for name in sorted(os.listdir(directory)):
+        if name.startswith("worker-") and name.endswith(".json"):
+            try:
+                with open(os.path.join(directory, name), encoding="utf-8") as data:
+                    snapshots.append(json.load(data))
+            except (OSError, ValueError):
+                # Vanished or half-written by a dying worker; skip it this scrape
+                continue
+    return merge_snapshots(snapshots)
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_prometheus(data):
+    """Prometheus text exposition (version 0.0.4) of a snapshot."""
+
+    lines = [
+        f"# HELP {REQUESTS_TOTAL} Requests by view, method and status code",
+        f"# TYPE {REQUESTS_TOTAL} counter",
+    ]
+    for key, count in sorted(data["requests"].items()):
+        view, method, status = key.split("\t")
+        lines.append(f'{REQUESTS_TOTAL}{{view="{_label(view)}",method="{_label(method)}",status="{status}"}} {count}')
+
+    for metric, (description, bounds) in HISTOGRAMS.items():
+        lines.append(f"# HELP {metric} {description}")
+        lines.append(f"# TYPE {metric} histogram")
+        for view, values in sorted(data["histograms"].get(metric, {}).items()):
+            view = _label(view)
+            cumulative = 0
+            for bound, count in zip((*bounds, "+Inf"), values[:-1]):
+                cumulative += count
+                lines.append(f'{metric}_bucket{{view="{view}",le="{bound}"}} {cumulative}')
+            lines.append(f'{metric}_sum{{view="{view}"}} {_number(values[-1])}')
+            lines.append(f'{metric}_count{{view="{view}"}} {cumulative}')
+    return "\n".join(lines) + "\n"
+
+
+class RequestStats:
+    """What one request spent in SQL and templates; also the SQL execute wrapper."""
+
+    def __init__(self, capture_sql=False):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.template_seconds = 0.0
+        self.rendering = False
+        self.statements = [] if capture_sql else None
+        # store.batching may run a request's queries on several threads
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.queries += 1
+                self.sql_seconds += elapsed
+                if self.statements is not None and len(self.statements) < SLOW_LOG_MAX_QUERIES:
+                    self.statements.append((elapsed, sql))
+
+
+_current = contextvars.ContextVar("store_request_stats", default=None)
+
+
+def install_template_timer():
+    """Time the outermost ``Template.render`` of each measured request."""
+
+    from django.template.base import Template
+
+    if getattr(Template.render, "store_metrics", False):
+        return
+    original = Template.render
+
+    def render(self, context):
+        stats = _current.get()
+        # {% include %} renders nested templates; only time the outermost one
+        if stats is None or stats.rendering:
+            return original(self, context)
+        stats.rendering = True
+        started = time.perf_counter()
+        try:
+            return original(self, context)
+        finally:
+            stats.template_seconds += time.perf_counter() - started
+            stats.rendering = False
+
+    render.store_metrics = True
+    Template.render = render
+
+
+@contextmanager
+def measure(capture_sql=False):
+    """Count the SQL and template time of the enclosed block into the yielded `RequestStats`."""
+
+    stats = RequestStats(capture_sql)
+    token = _current.set(stats)
+    try:
+        with connection.execute_wrapper(stats):
+            yield stats
+    finally:
+        _current.reset(token)
+
+
+@asynccontextmanager
+async def ameasure(capture_sql=False):
+    """Async version of `measure`."""
+
+    stats = RequestStats(capture_sql)
+    token = _current.set(stats)
+    # The async ORM queries from the request's sync thread, which has its
+    # own connection; install the wrapper there
+    wrapper = await sync_to_async(_enter_execute_wrapper)(stats)
+    try:
+        yield stats
+    finally:
+        await sync_to_async(wrapper.__exit__)(None, None, None)
+        _current.reset(token)
+
+
+def _enter_execute_wrapper(stats):
+    wrapper = connection.execute_wrapper(stats)
+    wrapper.__enter__()
+    return wrapper
+
+
+def record(view, method, status, seconds, stats, size=None):
+    """Observe one finished request into this thread's shard; call `flush` afterwards."""
+
+    shard = _shard()
+    shard.observe("store_request_duration_seconds", view, seconds)
+    shard.observe("store_request_sql_queries", view, stats.queries)
+    shard.observe("store_request_sql_duration_seconds", view, stats.sql_seconds)
+    if getattr(settings, "STORE_METRICS_TEMPLATE_TIMING", False):
+        shard.observe("store_request_template_duration_seconds", view, stats.template_seconds)
+    if size is not None:
+        shard.observe("store_response_size_bytes", view, size)
+    shard.requests[(view, method, status)] += 1
@@ -0,0 +1,168 @@
+"""
+store.middleware
+----------------
+
+Middleware for the `store` application.
+
+All of it works in sync and async mode, so under ASGI the async views
+(see store.async_views) are not pushed back onto a thread.
+"""
+
+import time
+from inspect import iscoroutine
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from . import metrics
+from .querybudget import QueryInspector, view_query_budget
+
+
+class _SyncAndAsyncMiddleware:
+    """Base for middleware that runs `__acall__` when the rest of the stack is async."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return self.call(request)
+
+
+class StaticFilesMiddleware(WhiteNoiseMiddleware):
+    """WhiteNoise, able to run in async mode (WhiteNoise 6 is sync-only)."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, settings=settings):
+        super().__init__(get_response, settings)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        # WhiteNoise's own __call__ serves static files and otherwise returns
+        # get_response(request), which here is the next layer's coroutine
+        response = super().__call__(request)
+        if iscoroutine(response):
+            response = await response
+        return response
+
+
+class CookieCartMiddleware(_SyncAndAsyncMiddleware):
+    """Write back a `CookieCart` changed during the request (see store.carts)."""
+
+    def call(self, request):
+        return self.process_response(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.process_response(request, await self.get_response(request))
+
+    @staticmethod
+    def process_response(request, response):
+        cart = getattr(request, "_store_cookie_cart", None)
+        if cart is not None:
+            cart.write(response)
+        return response
+
+
+class MetricsMiddleware(_SyncAndAsyncMiddleware):
+    """Record per-view latency, SQL, template time and response size (see store.metrics)."""
+
+    def __init__(self, get_response):
+        if not settings.STORE_METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+        if settings.STORE_METRICS_TEMPLATE_TIMING:
+            metrics.install_template_timer()
+
+    def call(self, request):
+        started = time.perf_counter()
+        with metrics.measure(capture_sql=bool(settings.STORE_SLOW_REQUEST_MS)) as stats:
+            response = self.get_response(request)
+        response = self.process_response(request, response, time.perf_counter() - started, stats)
+        metrics.flush()
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        async with metrics.ameasure(capture_sql=bool(settings.STORE_SLOW_REQUEST_MS)) as stats:
+            response = await self.get_response(request)
+        response = self.process_response(request, response, time.perf_counter() - started, stats)
+        # Writing the totals is file I/O; keep it off the event loop
+        if metrics.flush_due():
+            await sync_to_async(metrics.flush)()
+        return response
+
+    @staticmethod
+    def process_response(request, response, elapsed, stats):
+        match = getattr(request, "resolver_match", None)
+        view = match.view_name if match else metrics.UNRESOLVED_VIEW
+        # Streamed bodies are produced after the middleware returns
+        size = None if response.streaming else len(response.content)
+        metrics.record(view, request.method, response.status_code, elapsed, stats, size)
+
+        slow_ms = settings.STORE_SLOW_REQUEST_MS
+        if slow_ms and elapsed * 1000 >= slow_ms:
+            statements = "".join(f"\n  [{seconds * 1000:.1f} ms] {sql}" for seconds, sql in stats.statements)
+            metrics.logger.warning(
+                "Slow request %s %s (%s): %.1f ms, %d queries in %.1f ms, templates %.1f ms%s",
+                request.method,
+                request.get_full_path(),
+                view,
+                elapsed * 1000,
+                stats.queries,
+                stats.sql_seconds * 1000,
+                stats.template_seconds * 1000,
+                statements,
+            )
+        return response
+
+
+class QueryInspectionMiddleware(_SyncAndAsyncMiddleware):
+    """Log requests that exceed their view's query budget or repeat statements (see store.querybudget)."""
+
+    def __init__(self, get_response):
+        if not settings.STORE_QUERY_INSPECTION:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+
+    def call(self, request):
+        with QueryInspector() as inspector:
+            response = self.get_response(request)
+        return self.process_response(request, response, inspector)
+
+    async def __acall__(self, request):
+        async with QueryInspector() as inspector:
+            response = await self.get_response(request)
+        return self.process_response(request, response, inspector)
+
+    @staticmethod
+    def process_response(request, response, inspector):
+        match = getattr(request, "resolver_match", None)
+        problems = inspector.problems(view_query_budget(match.func) if match else None)
+        if problems:
+            metrics.logger.warning(
+                "%s %s (%s): %s\n%s",
+                request.method,
+                request.get_full_path(),
+                match.view_name if match else metrics.UNRESOLVED_VIEW,
+                "; ".join(problems),
+                inspector.report(),
+            )
+        return response
@@ -0,0 +1,48 @@
+from django.db import migrations
+
+
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS store_instrument_fts USING fts5("
+    "name, brand, description, specifications, "
+    "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')",
+    "INSERT INTO store_instrument_fts (rowid, name, brand, description, specifications) "
+    "SELECT id, name, brand, description, specifications FROM store_instrument",
+]
+SQLITE_REVERSE = ["DROP TABLE IF EXISTS store_instrument_fts"]
+
+POSTGRES_FORWARD = [
+    "ALTER TABLE store_instrument ADD COLUMN IF NOT EXISTS search_vector tsvector",
+    "UPDATE store_instrument SET search_vector = "
+    "setweight(to_tsvector('english', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(brand, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(description, '')), 'C') || "
+    "setweight(to_tsvector('english', coalesce(specifications, '')), 'D')",
+    "CREATE INDEX IF NOT EXISTS store_instrument_search_vector_gin ON store_instrument USING GIN (search_vector)",
+]
+POSTGRES_REVERSE = [
+    "DROP INDEX IF EXISTS store_instrument_search_vector_gin",
+    "ALTER TABLE store_instrument DROP COLUMN IF EXISTS search_vector",
+]
+
+
+def _run(statements_by_vendor):
+    def run(apps, schema_editor):
+        statements = statements_by_vendor.get(schema_editor.connection.vendor, [])
+        for statement in statements:
+            schema_editor.execute(statement)
+
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0003_cart_cartitem'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            _run({"sqlite": SQLITE_FORWARD, "postgresql": POSTGRES_FORWARD}),
+            _run({"sqlite": SQLITE_REVERSE, "postgresql": POSTGRES_REVERSE}),
+        ),
+    ]
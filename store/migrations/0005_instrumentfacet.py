@@ -0,0 +1,48 @@
+# Generated by Django 5.2.8 on 2026-10-18 01:14
+
+from collections import Counter
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def populate_facets(apps, schema_editor):
+    Instrument = apps.get_model('store', 'Instrument')
+    InstrumentFacet = apps.get_model('store', 'InstrumentFacet')
+
+    counts = Counter()
+    rows = Instrument.objects.filter(in_stock=True).values_list('category_id', 'brand', 'condition', 'featured')
+    for category_id, brand, condition, featured in rows.iterator():
+        counts[(category_id, 'brand', brand)] += 1
+        counts[(category_id, 'condition', 'new' if condition == 'new' else 'used')] += 1
+        if featured:
+            counts[(category_id, 'deal', '1')] += 1
+
+    InstrumentFacet.objects.bulk_create(
+        InstrumentFacet(category_id=category_id, facet=facet, value=value, count=count)
+        for (category_id, facet, value), count in counts.items()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0004_instrument_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InstrumentFacet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('facet', models.CharField(choices=[('brand', 'Brand'), ('condition', 'Condition'), ('deal', 'Deal')], max_length=20)),
+                ('value', models.CharField(max_length=100)),
+                ('count', models.IntegerField(default=0)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facets', to='store.category')),
+            ],
+            options={
+                'unique_together': {('category', 'facet', 'value')},
+            },
+        ),
+        migrations.RunPython(populate_facets, migrations.RunPython.noop),
+    ]
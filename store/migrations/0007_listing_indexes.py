@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-18 01:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0006_alter_cart_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='instrument',
+            index=models.Index(fields=['category', 'in_stock', '-created_at', '-id'], name='instrument_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='instrument',
+            index=models.Index(condition=models.Q(('in_stock', True)), fields=['category', 'condition', '-created_at', '-id'], name='instrument_category_cond_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='instrument',
+            index=models.Index(condition=models.Q(('in_stock', True)), fields=['-created_at', '-id'], name='instrument_in_stock_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='instrument',
+            index=models.Index(fields=['featured', 'in_stock', '-created_at'], name='instrument_featured_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='instrument',
+            index=models.Index(condition=models.Q(('in_stock', True)), fields=['brand', '-created_at'], name='instrument_brand_idx'),
+        ),
+    ]
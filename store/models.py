@@ -12,11 +12,12 @@ Notes:
   admin, not heavy business logic.
 """
 
-from django.contrib.staticfiles.storage import staticfiles_storage
 from django.db import models
-from django.templatetags.static import static
+from django.db.models.fields.files import FieldFile
 from django.urls import reverse
 
+from .images import image_srcsets, resolve_image_url
+
 
 class Category(models.Model):
     """Category of instruments.
@@ -77,10 +78,48 @@ class Instrument(models.Model):
 
     class Meta:
         ordering = ["-created_at"]
+        # Match the listing queries: in-stock rows filtered by category,
+        # condition, brand or featured, newest first with id as the keyset
+        # tie-breaker (see store.pagination). Partial indexes skip
+        # out-of-stock rows, which listings never show.
+        indexes = [
+            models.Index(fields=["category", "in_stock", "-created_at", "-id"], name="instrument_category_idx"),
+            models.Index(
+                fields=["category", "condition", "-created_at", "-id"],
+                condition=models.Q(in_stock=True),
+                name="instrument_category_cond_idx",
+            ),
+            models.Index(fields=["-created_at", "-id"], condition=models.Q(in_stock=True), name="instrument_in_stock_idx"),
+            models.Index(fields=["featured", "in_stock", "-created_at"], name="instrument_featured_idx"),
+            models.Index(fields=["brand", "-created_at"], condition=models.Q(in_stock=True), name="instrument_brand_idx"),
+        ]
 
     def __str__(self):
         return f"{self.brand} {self.name}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The stored values, so signal handlers (see store.signals) can
+        # tell what a save changes without reading the row again
+        instance._stored_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get("update_fields")
+        stored = getattr(self, "_stored_values", {}) if update_fields is not None else {}
+        for field in self._meta.concrete_fields:
+            if update_fields is None or field.name in update_fields or field.attname in update_fields:
+                value = field.value_from_object(self)
+                stored[field.attname] = value.name if isinstance(value, FieldFile) else value
+        self._stored_values = stored
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        # Unsaved changes to fields that were not reloaded are unknown
+        self.__dict__.pop("_stored_values", None)
+
     def get_absolute_url(self):
         """Return the URL to view the product detail page.
 
@@ -91,23 +130,46 @@ class Instrument(models.Model):
 
     @property
     def image_display_url(self):
-        """Return a usable URL for instrument images whether served from static or media."""
+        """Return a usable URL for instrument images whether served from static or media.
+
+        Existence checks go through the process-wide manifests in
+        `store.images`, so rendering a listing makes no storage calls.
+        """
+
+        return resolve_image_url(self.image.name if self.image else "")
+
+    @property
+    def image_srcsets(self):
+        """Return ``{"webp": ..., "jpeg": ...}`` srcset strings of resized copies.
+
+        Empty strings mean no derivatives exist yet (see
+        `manage.py build_image_derivatives`).
+        """
 
-        if not self.image:
-            return static("instruments/placeholder.svg")
+        return image_srcsets(self.image.name if self.image else "")
 
-        image_name = self.image.name
 
-        # Prefer the uploaded/media file if it exists
-        try:
-            if self.image.storage.exists(image_name):
-                return self.image.url
-        except Exception:
-            # If storage access fails, fall back to static lookup
-            pass
+class CartQuerySet(models.QuerySet):
+    """Query helpers for loading carts without per-item queries."""
+
+    def with_items(self):
+        """Prefetch items with their instrument and category in one query.
+
+        Combined with the cart lookup this loads a whole cart in two
+        queries; `Cart.get_total` and `Cart.get_item_count` then run
+        against the prefetched rows.
+        """
 
-        # Serve from static assets (dev finds files in STATICFILES_DIRS without collectstatic)
-        return static(image_name or "instruments/placeholder.svg")
+        items = CartItem.objects.select_related("instrument__category").order_by("added_at", "id")
+        return self.prefetch_related(models.Prefetch("items", queryset=items))
+
+    def with_totals(self):
+        """Annotate `item_count` and `total_amount` computed in the database."""
+
+        return self.annotate(
+            item_count=models.Sum("items__quantity"),
+            total_amount=models.Sum(models.F("items__quantity") * models.F("items__instrument__price")),
+        )
 
 
 class Cart(models.Model):
@@ -115,16 +177,38 @@ class Cart(models.Model):
 
     The cart is stored server-side and keyed by the Django session
     `session_key`. It holds related `CartItem` objects accessible via
-    the `items` related name.
+    the `items` related name. Load carts through
+    `Cart.objects.with_items()` when rendering them.
     """
 
     session_key = models.CharField(max_length=40, unique=True)
     created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
+    # Indexed for the abandoned-cart purge (see store.carts.purge_carts)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = CartQuerySet.as_manager()
 
     def __str__(self):
         return f"Cart {self.session_key}"
 
+    def get_totals(self):
+        """Return ``(item_count, total)`` computed in a single pass.
+
+        Uses the prefetched `items` when the cart was loaded through
+        `with_items()`; otherwise the items are fetched once.
+        """
+
+        items = self.items.all()
+        if "items" not in getattr(self, "_prefetched_objects_cache", {}):
+            items = items.select_related("instrument")
+
+        count = 0
+        total = 0
+        for item in items:
+            count += item.quantity
+            total += item.get_subtotal()
+        return count, total
+
     def get_total(self):
         """Compute the total price for all items in the cart.
 
@@ -133,12 +217,12 @@ class Cart(models.Model):
         in templates by prefetching `items` where appropriate.
         """
 
-        return sum(item.get_subtotal() for item in self.items.all())
+        return self.get_totals()[1]
 
     def get_item_count(self):
         """Return the total number of units across all cart items."""
 
-        return sum(item.quantity for item in self.items.all())
+        return self.get_totals()[0]
 
 
 class CartItem(models.Model):
@@ -163,3 +247,59 @@ class CartItem(models.Model):
         """Return the line total for this item (price * quantity)."""
 
         return self.instrument.price * self.quantity
+
+
+class EmptyCart:
+    """In-memory stand-in for a visitor who has no `Cart` row yet.
+
+    Read-only requests get this instead of a new session and `Cart`
+    row; the first mutation creates the real cart. It offers the parts
+    of the `Cart` interface used by templates and `CartSerializer`.
+    """
+
+    id = pk = None
+    session_key = ""
+    created_at = updated_at = None
+
+    @property
+    def items(self):
+        return CartItem.objects.none()
+
+    def get_totals(self):
+        return 0, 0
+
+    def get_total(self):
+        return 0
+
+    def get_item_count(self):
+        return 0
+
+
+class InstrumentFacet(models.Model):
+    """Denormalized count of in-stock instruments per category facet value.
+
+    Rows are maintained incrementally by `store.facets` from `Instrument`
+    save/delete signals so category pages can render their filter
+    controls without DISTINCT/COUNT scans over the instrument table.
+
+    - `facet`: which filter the row belongs to (brand, condition bucket
+      or deal flag)
+    - `value`: the facet value, e.g. ``"Fender"``, ``"new"``, ``"used"``
+    """
+
+    FACET_CHOICES = [
+        ("brand", "Brand"),
+        ("condition", "Condition"),
+        ("deal", "Deal"),
+    ]
+
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name="facets")
+    facet = models.CharField(max_length=20, choices=FACET_CHOICES)
+    value = models.CharField(max_length=100)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ("category", "facet", "value")
+
+    def __str__(self):
+        return f"{self.category_id}:{self.facet}={self.value} ({self.count})"
@@ -0,0 +1,239 @@
+"""
+store.pagination
+----------------
+
+Keyset (cursor) pagination shared by the HTML listings and the API.
+
+Offset pagination gets slower the deeper a client pages and shifts rows
+when the catalog changes between requests. Instead, each page remembers
+the ordering values of its last (or first) row and the next query asks
+for rows strictly after them, so every page is a bounded index range
+scan regardless of catalog size.
+
+The ordering is taken from the queryset (``Instrument`` defaults to
+``-created_at``) with the primary key appended as a tie-breaker, which
+gives ``(-created_at, -id)`` for plain listings and
+``(search_rank, -created_at, -id)`` for ranked search results. Ordering
+fields must not be nullable.
+
+Cursors are opaque to clients: URL-safe base64 of a small JSON document
+holding the boundary values and the paging direction.
+"""
+
+import base64
+import binascii
+import json
+from dataclasses import dataclass
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    """Raised when a client sends a cursor that cannot be decoded."""
+
+
+def _encode_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def encode_cursor(values, reverse=False):
+    payload = json.dumps({"v": [_encode_value(v) for v in values], "r": reverse}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return list(payload["v"]), bool(payload.get("r", False))
+    except (binascii.Error, ValueError, TypeError, KeyError, UnicodeDecodeError):
+        raise InvalidCursor("Invalid cursor")
+
+
+@dataclass
+class KeysetPage:
+    """A single page of results plus the cursors for its neighbours."""
+
+    object_list: list
+    next_cursor: str = None
+    previous_cursor: str = None
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginator:
+    """Paginate a queryset by its ordering columns instead of by offset."""
+
+    def __init__(self, queryset, page_size):
+        self.queryset = queryset
+        self.page_size = page_size
+        self.ordering = self._resolve_ordering(queryset)
+
+    @staticmethod
+    def _resolve_ordering(queryset):
+        ordering = list(queryset.query.order_by or queryset.model._meta.ordering)
+        names = {field.lstrip("-") for field in ordering}
+        if not names & {"pk", "id", queryset.model._meta.pk.name}:
+            # Inherit the direction of the leading column for the tie-breaker
+            ordering.append("-pk" if ordering and ordering[0].startswith("-") else "pk")
+        return ordering
+
+    @staticmethod
+    def _flip(field):
+        return field[1:] if field.startswith("-") else f"-{field}"
+
+    def _after(self, ordering, values):
+        """Build the filter selecting rows strictly after `values` in `ordering`."""
+
+        condition = Q()
+        for index, field in enumerate(ordering):
+            name = field.lstrip("-")
+            lookup = "lt" if field.startswith("-") else "gt"
+            clause = Q(**{f"{name}__{lookup}": values[index]})
+            for prior_field, prior_value in zip(ordering[:index], values):
+                clause &= Q(**{prior_field.lstrip("-"): prior_value})
+            condition |= clause
+        return condition
+
+    def _values(self, obj):
+        # Rows may be model instances or ``values()`` dicts; dicts have no "pk" key
+        if isinstance(obj, dict):
+            pk = self.queryset.model._meta.pk.attname
+            return [obj[pk if field.lstrip("-") == "pk" else field.lstrip("-")] for field in self.ordering]
+        return [getattr(obj, field.lstrip("-")) for field in self.ordering]
+
+    def _output_field(self, name):
+        if name in self.queryset.query.annotations:
+            return self.queryset.query.annotations[name].output_field
+        if name == "pk":
+            return self.queryset.model._meta.pk
+        return self.queryset.model._meta.get_field(name)
+
+    def _parse_values(self, values):
+        """Convert decoded cursor values to the types of their ordering fields."""
+
+        parsed = []
+        for field, value in zip(self.ordering, values):
+            try:
+                value = self._output_field(field.lstrip("-")).to_python(value)
+            except (ValidationError, TypeError, ValueError):
+                raise InvalidCursor("Invalid cursor")
+            # Ordering fields are never null, so neither are boundary values
+            if value is None:
+                raise InvalidCursor("Invalid cursor")
+            parsed.append(value)
+        return parsed
+
+    def _window(self, cursor):
+        """Return the queryset of rows after `cursor` and whether it runs backwards."""
+
+        reverse = False
+        queryset = self.queryset.order_by(*self.ordering)
+        if cursor:
+            values, reverse = decode_cursor(cursor)
+            if len(values) != len(self.ordering):
+                raise InvalidCursor("Invalid cursor")
+            values = self._parse_values(values)
+            ordering = [self._flip(field) for field in self.ordering] if reverse else self.ordering
+            queryset = queryset.filter(self._after(ordering, values)).order_by(*ordering)
+        return queryset[: self.page_size + 1], reverse
+
+    def _page(self, rows, cursor, reverse):
+        has_more = len(rows) > self.page_size
+        rows = rows[: self.page_size]
+        if reverse:
+            rows.reverse()
+
+        page = KeysetPage(object_list=rows)
+        if not rows:
+            return page
+
+        # Walking backwards always leaves the page we came from ahead of us,
+        # and walking forwards from a cursor leaves rows behind us.
+        if reverse or has_more:
+            page.next_cursor = encode_cursor(self._values(rows[-1]))
+        if (reverse and has_more) or (cursor and not reverse):
+            page.previous_cursor = encode_cursor(self._values(rows[0]), reverse=True)
+        return page
+
+    def page(self, cursor=None):
+        """Return the `KeysetPage` addressed by `cursor` (first page if None)."""
+
+        queryset, reverse = self._window(cursor)
+        return self._page(list(queryset), cursor, reverse)
+
+    async def apage(self, cursor=None):
+        """Async version of `page`, reading through the async ORM."""
+
+        queryset, reverse = self._window(cursor)
+        return self._page([row async for row in queryset], cursor, reverse)
+
+
+def page_size_from(value, default, maximum):
+    """Parse a client-supplied page size, clamped to ``[1, maximum]``."""
+
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(size, maximum))
+
+
+def paginate_request(request, queryset, page_size=None):
+    """Paginate `queryset` using the ``cursor`` query parameter.
+
+    Returns the `KeysetPage` with ``next_query``/``previous_query``
+    attributes: the current query string with the cursor swapped, ready
+    to be used as ``href="?{{ page.next_query }}"`` in templates.
+    Raises `InvalidCursor` for malformed cursors.
+    """
+
+    page = _paginator(queryset, page_size).page(request.GET.get("cursor"))
+    return _with_queries(request, page)
+
+
+async def apaginate_request(request, queryset, page_size=None):
+    """Async version of `paginate_request`."""
+
+    page = await _paginator(queryset, page_size).apage(request.GET.get("cursor"))
+    return _with_queries(request, page)
+
+
+def _paginator(queryset, page_size):
+    if page_size is None:
+        page_size = getattr(settings, "STORE_PAGE_SIZE", 24)
+    return KeysetPaginator(queryset, page_size)
+
+
+def _with_queries(request, page):
+    page.next_query = _with_cursor(request, page.next_cursor)
+    page.previous_query = _with_cursor(request, page.previous_cursor)
+    return page
+
+
+def _with_cursor(request, cursor):
+    if cursor is None:
+        return None
+    params = request.GET.copy()
+    params["cursor"] = cursor
+    return params.urlencode()
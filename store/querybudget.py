@@ -0,0 +1,154 @@
+"""
+store.querybudget
+-----------------
+
+Query budgets and N+1 detection for views.
+
+Views declare the most queries one request may take with
+``@query_budget(n)``. ``QueryInspector`` records the SQL a block of code
+runs (through ``connection.execute_wrapper``) and fingerprints each
+statement: Django passes parameters separately, so one statement issued
+for every row of a list (the N+1 pattern, e.g. ``instrument.category``
+without ``select_related``) shows up as the same fingerprint repeated.
+
+- ``QueryBudgetTestMixin.assertQueryBudget`` fails a test when the block
+  exceeds a budget or repeats a statement (``store.tests`` runs every
+  route in ``store.urls`` against its view's budget).
+- ``store.middleware.QueryInspectionMiddleware`` logs the same problems
+  for each request while developing (``STORE_QUERY_INSPECTION``,
+  defaults to ``DEBUG``).
+"""
+
+import contextvars
+import re
+from collections import Counter
+from contextlib import contextmanager
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection
+
+# Transaction control, which doesn't count towards budgets: tests run
+# inside a transaction, so their atomic blocks issue savepoints instead
+TRANSACTION_STATEMENTS = re.compile(r"^\s*(SAVEPOINT|RELEASE SAVEPOINT|ROLLBACK TO SAVEPOINT|BEGIN|COMMIT)\b", re.IGNORECASE)
+
+_unbudgeted = contextvars.ContextVar("store_unbudgeted", default=False)
+
+
+def query_budget(queries):
+    """Declare the most queries a request to the decorated view may run."""
+
+    def decorator(view):
+        view.query_budget = queries
+        return view
+
+    return decorator
+
+
+def view_query_budget(view):
+    return getattr(view, "query_budget", None)
+
+
+@contextmanager
+def unbudgeted():
+    """Leave the queries run inside the block out of every budget.
+
+    For occasional work a request may trigger on behalf of the whole
+    process, such as rebuilding the catalog snapshot (``store.catalog``).
+    """
+
+    token = _unbudgeted.set(True)
+    try:
+        yield
+    finally:
+        _unbudgeted.reset(token)
+
+
+def fingerprint(sql):
+    """Normalize `sql` so statements differing only in parameters compare equal."""
+
+    sql = re.sub(r"\s+", " ", sql).strip()
+    # IN (%s, %s, ...) varies in length with the list it was built from
+    sql = re.sub(r"IN \((?:%s, )*%s\)", "IN (...)", sql)
+    return re.sub(r"'(?:[^']|'')*'|\b\d+\b", "?", sql)
+
+
+class QueryInspector:
+    """Record the SQL run inside a ``with`` block and report N+1 patterns."""
+
+    def __init__(self, using=connection):
+        self.connection = using
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if not _unbudgeted.get():
+            self.statements.append(sql)
+        return execute(sql, params, many, context)
+
+    def __enter__(self):
+        self._wrapper = self.connection.execute_wrapper(self)
+        self._wrapper.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        return self._wrapper.__exit__(*exc_info)
+
+    # The async ORM queries from the request's sync thread, which has its
+    # own connection; install the wrapper there
+    async def __aenter__(self):
+        await sync_to_async(self.__enter__)()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return await sync_to_async(self.__exit__)(*exc_info)
+
+    @property
+    def queries(self):
+        return [sql for sql in self.statements if not TRANSACTION_STATEMENTS.match(sql)]
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    def repeated(self, threshold=None):
+        """Fingerprints run at least `threshold` times (``STORE_NPLUSONE_THRESHOLD``), most frequent first."""
+
+        threshold = threshold or settings.STORE_NPLUSONE_THRESHOLD
+        counts = Counter(fingerprint(sql) for sql in self.queries)
+        return [(sql, count) for sql, count in counts.most_common() if count >= threshold]
+
+    def problems(self, budget=None, threshold=None):
+        """Human-readable budget overruns and repeated statements."""
+
+        problems = []
+        if budget is not None and self.count > budget:
+            problems.append(f"{self.count} queries (budget {budget})")
+        problems.extend(f"{count}x (possible N+1): {sql}" for sql, count in self.repeated(threshold))
+        return problems
+
+    def report(self):
+        return "\n".join(f"  {number}. {sql}" for number, sql in enumerate(self.queries, 1))
+
+
+class QueryBudgetTestMixin:
+    """``TestCase`` mixin adding ``assertQueryBudget``."""
+
+    def assertQueryBudget(self, budget, threshold=None):
+        """Context manager failing when the block exceeds `budget` queries or repeats a statement."""
+
+        return _QueryBudgetContext(self, budget, threshold)
+
+
+class _QueryBudgetContext(QueryInspector):
+    def __init__(self, test_case, budget, threshold):
+        super().__init__()
+        self.test_case = test_case
+        self.budget = budget
+        self.threshold = threshold
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        super().__exit__(exc_type, exc_value, traceback)
+        if exc_type is None:
+            problems = self.problems(self.budget, self.threshold)
+            if problems:
+                self.test_case.fail("; ".join(problems) + "\nQueries:\n" + self.report())
@@ -0,0 +1,211 @@
+"""
+store.search
+------------
+
+Pluggable full-text search over the instrument catalog.
+
+The views used to search with ``icontains`` lookups across several text
+columns, which forces a full scan of the ``description`` column on every
+query. This module keeps an inverted index next to ``Instrument`` and
+exposes a small backend interface used by the HTML and API views:
+
+- ``SQLiteFTSBackend``: an FTS5 virtual table (``store_instrument_fts``)
+  keyed by the instrument primary key.
+- ``PostgresSearchBackend``: a weighted ``tsvector`` column on
+  ``store_instrument`` backed by a GIN index.
+- ``SimpleSearchBackend``: the original ``icontains`` behaviour, used for
+  any other database vendor.
+
+The index tables are created by migration ``0004_instrument_search_index``
+and kept in sync by the signal handlers in ``store.signals``. Writes that
+bypass signals (``bulk_create``, ``QuerySet.update``) should be followed
+by ``manage.py rebuild_search_index``.
+
+Set ``STORE_SEARCH_BACKEND`` to a dotted path to override the choice made
+from the database vendor.
+"""
+
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import BooleanField, FloatField, Q
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from .models import Instrument
+
+# Words are indexed individually; anything else in the query is ignored so
+# user input can never break out of the MATCH / tsquery syntax.
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(query):
+    """Split a raw search string into lower-cased index terms."""
+
+    return [token.lower() for token in _TOKEN_RE.findall(query or "")]
+
+
+class BaseSearchBackend:
+    """Interface shared by all search backends.
+
+    ``search`` returns the given queryset narrowed to matching rows,
+    annotated with ``search_rank`` and ordered by relevance (ties broken
+    by the model's default ``-created_at`` ordering and then ``-id``).
+    """
+
+    # Ordering applied to the annotated ``search_rank`` value
+    rank_ordering = "-search_rank"
+
+    def index(self, instrument):
+        """Add or refresh a single instrument in the index."""
+
+    def remove(self, pk):
+        """Drop a single instrument from the index."""
+
+    def rebuild(self):
+        """Re-index the whole catalog from the ``Instrument`` table."""
+
+    def search(self, queryset, query):
+        raise NotImplementedError
+
+    def _ranked(self, queryset, rank_sql, params=()):
+        return queryset.annotate(search_rank=RawSQL(rank_sql, params, output_field=FloatField())).order_by(
+            self.rank_ordering, "-created_at", "-id"
+        )
+
+
+class SimpleSearchBackend(BaseSearchBackend):
+    """Index-less fallback matching every term with ``icontains``."""
+
+    def search(self, queryset, query):
+        terms = tokenize(query)
+        if not terms:
+            return queryset
+
+        for term in terms:
+            queryset = queryset.filter(Q(name__icontains=term) | Q(brand__icontains=term) | Q(description__icontains=term) | Q(specifications__icontains=term))
+
+        # No relevance signal is available, so every row ranks equally
+        return queryset.annotate(search_rank=RawSQL("0", [], output_field=FloatField())).order_by("-created_at", "-id")
+
+
+class SQLiteFTSBackend(BaseSearchBackend):
+    """SQLite FTS5 index stored in the ``store_instrument_fts`` table.
+
+    Every term is matched as a prefix (``"fend"*``) so search-as-you-type
+    keeps working, and results are ranked with ``bm25`` weighting name
+    matches above brand, description and specifications.
+    """
+
+    table = "store_instrument_fts"
+    # bm25() returns lower-is-better scores
+    rank_ordering = "search_rank"
+    # Column weights for bm25(): name, brand, description, specifications
+    weights = (10.0, 5.0, 1.0, 0.5)
+
+    def index(self, instrument):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table} WHERE rowid = %s", [instrument.pk])
+            cursor.execute(
+                f"INSERT INTO {self.table} (rowid, name, brand, description, specifications) VALUES (%s, %s, %s, %s, %s)",
+                [instrument.pk, instrument.name, instrument.brand, instrument.description, instrument.specifications],
+            )
+
+    def remove(self, pk):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table} WHERE rowid = %s", [pk])
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table}")
+            cursor.execute(
+                f"INSERT INTO {self.table} (rowid, name, brand, description, specifications) "
+                f"SELECT id, name, brand, description, specifications FROM {Instrument._meta.db_table}"
+            )
+
+    def search(self, queryset, query):
+        terms = tokenize(query)
+        if not terms:
+            return queryset
+
+        match = " ".join(f'"{term}"*' for term in terms)
+        weights = ", ".join(str(weight) for weight in self.weights)
+        # Join the index once: bm25() then reads the rank of the joined row
+        # instead of re-running the MATCH for every result
+        queryset = queryset.extra(
+            tables=[self.table],
+            where=[f"{self.table}.rowid = {Instrument._meta.db_table}.id", f"{self.table} MATCH %s"],
+            params=[match],
+        )
+        return self._ranked(queryset, f"bm25({self.table}, {weights})")
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """Weighted ``tsvector`` column (``search_vector``) with a GIN index."""
+
+    config = "english"
+    vector_sql = (
+        "setweight(to_tsvector(%(config)s, coalesce(name, '')), 'A') || "
+        "setweight(to_tsvector(%(config)s, coalesce(brand, '')), 'A') || "
+        "setweight(to_tsvector(%(config)s, coalesce(description, '')), 'C') || "
+        "setweight(to_tsvector(%(config)s, coalesce(specifications, '')), 'D')"
+    )
+
+    def _vector(self):
+        return self.vector_sql % {"config": f"'{self.config}'"}
+
+    def index(self, instrument):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {Instrument._meta.db_table} SET search_vector = {self._vector()} WHERE id = %s",
+                [instrument.pk],
+            )
+
+    def remove(self, pk):
+        # The vector lives on the instrument row and disappears with it
+        pass
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"UPDATE {Instrument._meta.db_table} SET search_vector = {self._vector()}")
+
+    def search(self, queryset, query):
+        terms = tokenize(query)
+        if not terms:
+            return queryset
+
+        tsquery = " & ".join(f"{term}:*" for term in terms)
+        column = f"{Instrument._meta.db_table}.search_vector"
+        ts_sql = f"to_tsquery('{self.config}', %s)"
+        # A query of stop words only ("the", "and a") is empty after
+        # normalization and would match nothing; treat it like no query
+        queryset = queryset.filter(
+            RawSQL(f"(numnode({ts_sql}) = 0 OR {column} @@ {ts_sql})", [tsquery, tsquery], output_field=BooleanField())
+        )
+        return self._ranked(queryset, f"ts_rank_cd({column}, {ts_sql})", [tsquery])
+
+
+_VENDOR_BACKENDS = {
+    "sqlite": SQLiteFTSBackend,
+    "postgresql": PostgresSearchBackend,
+}
+
+_backend = None
+
+
+def get_search_backend():
+    """Return the configured search backend instance (created once)."""
+
+    global _backend
+    if _backend is None:
+        path = getattr(settings, "STORE_SEARCH_BACKEND", None)
+        backend_class = import_string(path) if path else _VENDOR_BACKENDS.get(connection.vendor, SimpleSearchBackend)
+        _backend = backend_class()
+    return _backend
+
+
+def search_instruments(queryset, query):
+    """Narrow an ``Instrument`` queryset to `query`, ranked by relevance."""
+
+    return get_search_backend().search(queryset, query)
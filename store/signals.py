@@ -0,0 +1,145 @@
+"""
+store.signals
+-------------
+
+Signal handlers that keep derived data (search index, facet counts,
+catalog snapshot, cached pages, image manifest) in sync with the catalog models. They are
+connected when the app registry is ready (see ``StoreConfig.ready``).
+"""
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_save
+from django.dispatch import receiver
+
+from . import facets
+from .cache import invalidate_tags
+from .catalog import invalidate_catalog
+from .images import media_manifest, schedule_derivatives
+from .models import Category, Instrument
+from .search import get_search_backend
+
+# Stored instrument values needed by the post_save handlers
+_PREVIOUS_FIELDS = facets.STATE_FIELDS + ("slug", "image")
+
+
+@receiver(pre_save, sender=Instrument, dispatch_uid="store_capture_instrument_state")
+def capture_instrument_state(sender, instance, **kwargs):
+    """Remember the stored values of an instrument about to be saved.
+
+    Instances loaded from the database carry their stored values (see
+    ``Instrument.from_db``); others are read back only if they have a pk.
+    """
+
+    stored = getattr(instance, "_stored_values", None)
+    if stored is not None and all(name in stored for name in _PREVIOUS_FIELDS):
+        previous = {name: stored[name] for name in _PREVIOUS_FIELDS}
+    elif instance.pk is not None:
+        previous = Instrument.objects.filter(pk=instance.pk).values(*_PREVIOUS_FIELDS).first()
+    else:
+        previous = None
+    instance._previous_state = previous
+
+
+@receiver(post_save, sender=Instrument, dispatch_uid="store_index_instrument")
+def index_instrument(sender, instance, **kwargs):
+    """Refresh the search index entry for a saved instrument."""
+
+    get_search_backend().index(instance)
+
+
+@receiver(post_delete, sender=Instrument, dispatch_uid="store_unindex_instrument")
+def unindex_instrument(sender, instance, **kwargs):
+    """Remove a deleted instrument from the search index."""
+
+    get_search_backend().remove(instance.pk)
+
+
+@receiver(post_save, sender=Instrument, dispatch_uid="store_process_instrument_image")
+def process_instrument_image(sender, instance, raw=False, using=None, **kwargs):
+    """Publish a newly stored image and schedule its responsive derivatives."""
+
+    if not instance.image:
+        return
+
+    # Make the new file visible to `image_display_url` immediately
+    media_manifest.refresh()
+
+    previous = getattr(instance, "_previous_state", None)
+    if raw or (previous is not None and previous["image"] == instance.image.name):
+        return
+    schedule_derivatives(instance.image.name, using=using)
+
+
+@receiver(post_save, sender=Instrument, dispatch_uid="store_update_facets")
+def update_facets(sender, instance, **kwargs):
+    """Adjust per-category facet counts for a saved instrument."""
+
+    if facets.instrument_saved(instance, getattr(instance, "_previous_state", None)):
+        invalidate_catalog()
+
+
+@receiver(post_delete, sender=Instrument, dispatch_uid="store_remove_facets")
+def remove_facets(sender, instance, **kwargs):
+    """Drop a deleted instrument from the per-category facet counts."""
+
+    if facets.instrument_deleted(instance):
+        invalidate_catalog()
+
+
+def _invalidate_on_commit(tags):
+    # Invalidate after commit so no worker re-caches pre-commit data
+    transaction.on_commit(lambda: invalidate_tags(*tags))
+
+
+@receiver(post_save, sender=Instrument, dispatch_uid="store_invalidate_saved_instrument")
+@receiver(post_delete, sender=Instrument, dispatch_uid="store_invalidate_deleted_instrument")
+def invalidate_instrument_pages(sender, instance, **kwargs):
+    """Invalidate cached pages that show this instrument."""
+
+    slugs = {instance.slug}
+    category_ids = {instance.category_id}
+    previous = getattr(instance, "_previous_state", None)
+    if previous is not None:
+        slugs.add(previous["slug"])
+        category_ids.add(previous["category_id"])
+
+    # Forms and most callers have the category loaded; look up only the others
+    category_slugs = set()
+    if Instrument.category.is_cached(instance) and instance.category is not None:
+        category_slugs.add(instance.category.slug)
+        category_ids.discard(instance.category_id)
+    category_ids.discard(None)
+    if category_ids:
+        category_slugs.update(Category.objects.filter(pk__in=category_ids).values_list("slug", flat=True))
+    tags = ["instruments"]
+    tags += [f"instrument:{slug}" for slug in slugs]
+    tags += [f"category:{slug}" for slug in category_slugs]
+    _invalidate_on_commit(tags)
+
+
+@receiver(pre_save, sender=Category, dispatch_uid="store_capture_category_slug")
+def capture_category_slug(sender, instance, **kwargs):
+    """Remember the stored slug of a category about to be saved."""
+
+    previous = None
+    if instance.pk is not None:
+        previous = Category.objects.filter(pk=instance.pk).values_list("slug", flat=True).first()
+    instance._previous_slug = previous
+
+
+@receiver(post_save, sender=Category, dispatch_uid="store_invalidate_saved_category")
+@receiver(post_delete, sender=Category, dispatch_uid="store_invalidate_deleted_category")
+def invalidate_category_pages(sender, instance, **kwargs):
+    """Invalidate cached pages that list or show this category."""
+
+    # Before the page tags, so pages re-rendered after commit read the new snapshot
+    invalidate_catalog()
+    slugs = {instance.slug, getattr(instance, "_previous_slug", None)} - {None}
+    _invalidate_on_commit(["categories"] + [f"category:{slug}" for slug in slugs])
+
+
+@receiver(post_migrate, dispatch_uid="store_catalog_migrated")
+def invalidate_catalog_after_migrate(sender, using, **kwargs):
+    """Rebuild the catalog snapshot after migrations (test database flushes included)."""
+
+    invalidate_catalog(using)
@@ -10,6 +10,7 @@ Naming convention:
     can reference routes reliably.
 """
 
+from django.conf import settings
 from django.urls import path
 from . import views
 from . import api_views
@@ -36,12 +37,23 @@ urlpatterns = [
     path("cart/add/<slug:slug>/", views.add_to_cart, name="add_to_cart"),
     path("cart/update/<int:item_id>/", views.update_cart_item, name="update_cart_item"),
     path("cart/remove/<int:item_id>/", views.remove_from_cart, name="remove_from_cart"),
+    path("cart/checkout/", views.checkout, name="checkout"),
+    # Prometheus scrape target (local clients only)
+    path("metrics", views.metrics, name="metrics"),
     # API endpoints
     path("api/categories/", api_views.api_categories, name="api_categories"),
     path("api/instruments/", api_views.api_instruments, name="api_instruments"),
+    path("api/instruments/export.ndjson", api_views.api_instruments_export, name="api_instruments_export"),
     path("api/instruments/<slug:slug>/", api_views.api_instrument_detail, name="api_instrument_detail"),
     path("api/cart/", api_views.api_cart, name="api_cart"),
     path("api/cart/add/", api_views.api_cart_add, name="api_cart_add"),
+    path("api/cart/batch/", api_views.api_cart_batch, name="api_cart_batch"),
     path("api/cart/items/<int:item_id>/", api_views.api_cart_item_update, name="api_cart_item_update"),
     path("api/cart/items/<int:item_id>/remove/", api_views.api_cart_item_remove, name="api_cart_item_remove"),
 ]
+
+# ASGI deployments serve the read-heavy routes from async views
+if settings.STORE_ASYNC_VIEWS:
+    from .async_views import use_async_views
+
+    urlpatterns = use_async_views(urlpatterns)
@@ -9,17 +9,41 @@ backed `Cart` model.
 Design notes:
 - Keep views lightweight. Heavy filtering and business logic is
   delegated to helper functions (`_parse_filters`, `_apply_filters`).
-- The cart is session-backed (see `get_or_create_cart`) so views rely
-  on a session key rather than user authentication.
+  The querysets and contexts of the catalog pages are built by
+  functions shared with their async versions (`store.async_views`),
+  which differ only in how they await the reads.
+- Each view declares its query budget (`store.querybudget`), which the
+  test suite enforces for every route.
+- Catalog pages issue their independent reads together
+  (`store.batching.fetch_together`).
+- Categories and facet counts come from the process-wide catalog
+  snapshot (`store.catalog`), so navigation and filters take no queries.
+- The cart is session-backed (see `get_cart`/`get_or_create_cart`) so
+  views rely on a session key rather than user authentication. Only
+  mutations create the session and the `Cart` row.
 """
 
+from dataclasses import dataclass
+from functools import partial
+
+from django.http import Http404
 from django.shortcuts import render, get_object_or_404
-from django.db.models import Q
+from django.db.models import Count, Q
+from .batching import fetch_together
+from .cache import add_cache_tags, cached_catalog_page
+from .catalog import catalog_snapshot
+from .facets import FacetCounts
 from .models import Instrument, Category
+from .pagination import InvalidCursor, paginate_request
+from .querybudget import query_budget
+from .search import search_instruments
 
+# Session key caching the cart badge count (see `remember_cart_count`)
+CART_COUNT_SESSION_KEY = "cart_item_count"
 
-def home(request):
-    """Homepage view with featured instruments.
+
+def _featured_instruments(request):
+    """Return ``(featured instruments, selected brands)`` for the homepage.
 
     Shows instruments marked as `featured` and `in_stock`. Supports a
     simple brand filter via query parameters `?brand=...` (multiple
@@ -27,49 +51,58 @@ def home(request):
     homepage layout.
     """
 
-    featured_instruments = Instrument.objects.filter(featured=True, in_stock=True)
-    categories = Category.objects.all()
-
-    # Distinct list of brands to populate filter controls in the template
-    brands = Instrument.objects.values_list("brand", flat=True).distinct().order_by("brand")
+    featured = Instrument.objects.select_related("category").filter(featured=True, in_stock=True)
 
     # Selected brands come from query parameters like ?brand=Fender&brand=Gibson
     selected_brands = request.GET.getlist("brand")
 
     if selected_brands:
         # Narrow the featured set to selected brands
-        featured_instruments = featured_instruments.filter(brand__in=selected_brands)
+        featured = featured.filter(brand__in=selected_brands)
 
     # Limit the number of featured instruments displayed on the homepage
-    featured_instruments = featured_instruments[:6]
+    return featured[:6], selected_brands
 
-    context = {
-        "featured_instruments": featured_instruments,
-        "categories": categories,
-        "brands": brands,
+
+def _home_context(featured, selected_brands, snapshot):
+    # Categories and brands for the filter controls come from the catalog snapshot
+    return {
+        "featured_instruments": featured,
+        "categories": snapshot.categories,
+        "brands": snapshot.facets().brand_names,
         "selected_brands": selected_brands,
     }
-    return render(request, "store/home.html", context)
 
 
-def product_list(request):
-    """List searchable and filterable products.
+@query_budget(2)
+@cached_catalog_page("instruments", "categories")
+def home(request):
+    """Homepage view with featured instruments (see `_featured_instruments`)."""
+
+    featured, selected_brands = _featured_instruments(request)
+    return render(request, "store/home.html", _home_context(featured, selected_brands, catalog_snapshot()))
+
+
+def _product_list_filters(request, snapshot):
+    """Return the instruments `product_list` shows and the filter values applied.
 
     Supports the following query parameters:
     - `category`: category slug to filter by
     - `condition`: one of the condition choices (e.g. 'new', 'used')
     - `brand`: repeatable parameter to filter by brand (e.g. ?brand=Fender)
-    - `search`: full-text-like search across `name`, `brand`, and `description`
+    - `search`: full-text search across `name`, `brand`, `description`
+      and `specifications`, ranked by relevance
     """
 
-    instruments = Instrument.objects.filter(in_stock=True)
-    categories = Category.objects.all()
+    instruments = Instrument.objects.select_related("category").filter(in_stock=True)
 
-    # Optional category filtering with validation via get_object_or_404
+    # Optional category filtering, 404ing on an unknown slug
     category_slug = request.GET.get("category")
     if category_slug:
-        category = get_object_or_404(Category, slug=category_slug)
-        instruments = instruments.filter(category=category)
+        category = snapshot.category(category_slug)
+        if category is None:
+            raise Http404("No Category matches the given query.")
+        instruments = instruments.filter(category_id=category.id)
 
     # Filter by `condition` if provided
     condition = request.GET.get("condition")
@@ -81,25 +114,55 @@ def product_list(request):
     if selected_brands:
         instruments = instruments.filter(brand__in=selected_brands)
 
-    # Simple search across several text fields
+    # Indexed full-text search, ranked by relevance (see `store.search`)
     search_query = request.GET.get("search")
     if search_query:
-        instruments = instruments.filter(Q(name__icontains=search_query) | Q(brand__icontains=search_query) | Q(description__icontains=search_query))
+        instruments = search_instruments(instruments, search_query)
 
-    brands = Instrument.objects.values_list("brand", flat=True).distinct().order_by("brand")
-
-    context = {
-        "instruments": instruments,
-        "categories": categories,
+    filters = {
         "selected_category": category_slug,
         "selected_condition": condition,
         "search_query": search_query,
-        "brands": brands,
         "selected_brands": selected_brands,
     }
-    return render(request, "store/product_list.html", context)
+    return instruments, filters
+
+
+def _product_list_context(page, result_count, filters, snapshot):
+    return {
+        "instruments": page.object_list,
+        "page": page,
+        "result_count": result_count,
+        "categories": snapshot.categories,
+        "brands": snapshot.facets(filters["selected_category"]).brand_names,
+        **filters,
+    }
+
+
+@query_budget(3)
+@cached_catalog_page("instruments", "categories")
+def product_list(request):
+    """List searchable and filterable products.
+
+    Filters are described in `_product_list_filters`; `cursor` is the
+    opaque keyset pagination cursor (see `store.pagination`).
+    """
+
+    # Categories and brands come from the catalog snapshot
+    snapshot = catalog_snapshot()
+    instruments, filters = _product_list_filters(request, snapshot)
+    page, result_count = fetch_together(partial(_paginate, request, instruments), instruments.count)
+    return render(request, "store/product_list.html", _product_list_context(page, result_count, filters, snapshot))
 
 
+def _related_instruments(instrument):
+    """A few in-stock instruments from the same category as `instrument`."""
+
+    return Instrument.objects.select_related("category").filter(category=instrument.category, in_stock=True).exclude(id=instrument.id)[:4]
+
+
+@query_budget(3)
+@cached_catalog_page("categories")
 def product_detail(request, slug):
     """Detailed view of a single instrument.
 
@@ -107,24 +170,35 @@ def product_detail(request, slug):
     category for display under the product details.
     """
 
-    instrument = get_object_or_404(Instrument, slug=slug)
-    related_instruments = Instrument.objects.filter(category=instrument.category, in_stock=True).exclude(id=instrument.id)[:4]
+    instrument = get_object_or_404(Instrument.objects.select_related("category"), slug=slug)
+    add_cache_tags(request, f"instrument:{instrument.slug}", f"category:{instrument.category.slug}")
 
     context = {
         "instrument": instrument,
-        "related_instruments": related_instruments,
+        "related_instruments": _related_instruments(instrument),
     }
     return render(request, "store/product_detail.html", context)
 
 
+@query_budget(2)
+@cached_catalog_page("instruments", "categories")
 def category_list(request):
     """Simple list of all categories for navigation pages."""
 
-    categories = Category.objects.all()
+    categories = Category.objects.annotate(instrument_count=Count("instruments"))
     context = {"categories": categories}
     return render(request, "store/category_list.html", context)
 
 
+def _paginate(request, queryset):
+    """Return the keyset page for the request, 404ing on a malformed cursor."""
+
+    try:
+        return paginate_request(request, queryset)
+    except InvalidCursor:
+        raise Http404("Invalid page cursor")
+
+
 def _parse_filters(request):
     """Centralize parsing of query parameters used by category pages.
 
@@ -167,122 +241,175 @@ def _apply_filters(queryset, condition, deals_active, selected_brands=None):
     return queryset
 
 
-def _category_context(request, queryset, page_title, page_description):
-    """Compose a consistent template context for category-style pages.
+@dataclass(frozen=True)
+class CategoryPage:
+    """What sets one category-style page apart from the others.
 
-    Accepts a base `queryset` containing instruments and returns a
-    dictionary containing UI-related flags and the filtered instruments.
+    A page lists the in-stock instruments of `category_slug`, or those
+    matching `match` when it spans categories. Filter counts of a
+    category come from the catalog snapshot; for `match` pages they are
+    computed from the base queryset.
     """
 
-    condition, deals_active, selected_brands = _parse_filters(request)
-    filtered = _apply_filters(queryset, condition, deals_active, selected_brands)
+    template: str
+    page_title: str
+    page_description: str
+    category_slug: str = None
+    match: Q = None
+
+    def queryset(self):
+        if self.category_slug:
+            return Instrument.objects.filter(category__slug=self.category_slug, in_stock=True)
+        return Instrument.objects.filter(self.match, in_stock=True)
+
+    @property
+    def cache_tags(self):
+        return (f"category:{self.category_slug}" if self.category_slug else "instruments", "categories")
+
+
+GUITARS_PAGE = CategoryPage(
+    "store/guitars.html",
+    page_title="Guitars",
+    page_description="Explore our collection of acoustic and electric guitars",
+    category_slug="guitars",
+)
+BASSES_PAGE = CategoryPage(
+    "store/basses.html",
+    page_title="Bass Guitars",
+    page_description="Find your perfect bass guitar - electric and acoustic models",
+    category_slug="bass-guitars",
+)
+DRUMS_PAGE = CategoryPage(
+    "store/drums.html",
+    page_title="Drums & Percussion",
+    page_description="Complete drum kits and percussion instruments",
+    category_slug="drums",
+)
+HORNS_PAGE = CategoryPage(
+    "store/horns.html",
+    page_title="Horns & Wind Instruments",
+    page_description="Saxophones, trumpets, flutes, and more",
+    category_slug="wind-instruments",
+)
+KEYBOARDS_PAGE = CategoryPage(
+    "store/keyboards.html",
+    page_title="Keyboards & Pianos",
+    page_description="Digital pianos, synthesizers, and MIDI keyboards",
+    category_slug="keyboards",
+)
+# Explicit amp/effect categories or instruments whose name contains related keywords
+AMPS_EFFECTS_PAGE = CategoryPage(
+    "store/amps_effects.html",
+    page_title="Amps & Effects",
+    page_description="Amplifiers, effect pedals, and audio gear",
+    match=Q(category__slug="amps-effects") | Q(name__icontains="amp") | Q(name__icontains="effect") | Q(name__icontains="pedal"),
+)
+
+
+def _category_context(request, page):
+    """Compose a consistent template context for the category-style `page`.
+
+    Returns a dictionary containing UI-related flags and the current
+    page of filtered instruments.
+    """
+
+    filters = _parse_filters(request)
+    queryset = page.queryset()
+    filtered = _apply_filters(queryset, *filters)
+    snapshot = catalog_snapshot()
+
+    if page.category_slug:
+        instruments, facets = _paginate(request, filtered), snapshot.facets(page.category_slug)
+    else:
+        # Independent reads, run together (see `store.batching`)
+        instruments, facets = fetch_together(partial(_paginate, request, filtered), partial(_brand_facets, queryset))
+    return _category_page_context(page, instruments, facets, snapshot.categories, filters)
+
+
+def _brand_facets(queryset):
+    return FacetCounts(brands=tuple(_brand_counts(queryset)))
+
+
+def _brand_counts(queryset):
+    return queryset.order_by("brand").values_list("brand").annotate(count=Count("id"))
+
 
-    brands = Instrument.objects.values_list("brand", flat=True).distinct().order_by("brand")
+def _category_page_context(page, instruments, facets, categories, filters):
+    """The context dict of `_category_context`, from already-fetched parts."""
 
+    condition, deals_active, selected_brands = filters
     return {
-        "instruments": filtered,
-        "page_title": page_title,
-        "page_description": page_description,
-        "categories": Category.objects.all(),
+        "instruments": instruments.object_list,
+        "page": instruments,
+        "page_title": page.page_title,
+        "page_description": page.page_description,
+        "categories": categories,
         "selected_condition": condition,
         "deals_active": deals_active,
         "star_range": range(1, 6),
         "condition_all_checked": condition in (None, "", "all"),
         "condition_new_checked": condition == "new",
         "condition_used_checked": condition == "used",
-        "brands": brands,
+        "brands": facets.brand_names,
+        "brand_facets": facets.brands,
+        "facets": facets,
         "selected_brands": selected_brands,
     }
 
 
-def guitars_page(request):
-    """Guitars category page.
+def _render_category_page(request, page):
+    return render(request, page.template, _category_context(request, page))
 
-    Uses `_category_context` to build a template-friendly payload.
-    """
 
-    queryset = Instrument.objects.filter(category__slug="guitars", in_stock=True)
-    context = _category_context(
-        request,
-        queryset,
-        page_title="Guitars",
-        page_description="Explore our collection of acoustic and electric guitars",
-    )
-    return render(request, "store/guitars.html", context)
+@query_budget(2)
+@cached_catalog_page(*GUITARS_PAGE.cache_tags)
+def guitars_page(request):
+    """Guitars category page."""
+
+    return _render_category_page(request, GUITARS_PAGE)
 
 
+@query_budget(2)
+@cached_catalog_page(*BASSES_PAGE.cache_tags)
 def basses_page(request):
     """Bass Guitars category page."""
 
-    queryset = Instrument.objects.filter(category__slug="bass-guitars", in_stock=True)
-    context = _category_context(
-        request,
-        queryset,
-        page_title="Bass Guitars",
-        page_description="Find your perfect bass guitar - electric and acoustic models",
-    )
-    return render(request, "store/basses.html", context)
+    return _render_category_page(request, BASSES_PAGE)
 
 
+@query_budget(2)
+@cached_catalog_page(*DRUMS_PAGE.cache_tags)
 def drums_page(request):
     """Drums & percussion category page."""
 
-    queryset = Instrument.objects.filter(category__slug="drums", in_stock=True)
-    context = _category_context(
-        request,
-        queryset,
-        page_title="Drums & Percussion",
-        page_description="Complete drum kits and percussion instruments",
-    )
-    return render(request, "store/drums.html", context)
+    return _render_category_page(request, DRUMS_PAGE)
 
 
+@query_budget(2)
+@cached_catalog_page(*HORNS_PAGE.cache_tags)
 def horns_page(request):
     """Horns and wind instruments category page."""
 
-    queryset = Instrument.objects.filter(category__slug="wind-instruments", in_stock=True)
-    context = _category_context(
-        request,
-        queryset,
-        page_title="Horns & Wind Instruments",
-        page_description="Saxophones, trumpets, flutes, and more",
-    )
-    return render(request, "store/horns.html", context)
+    return _render_category_page(request, HORNS_PAGE)
 
 
+@query_budget(2)
+@cached_catalog_page(*KEYBOARDS_PAGE.cache_tags)
 def keyboards_page(request):
     """Keyboards and pianos category page."""
 
-    queryset = Instrument.objects.filter(category__slug="keyboards", in_stock=True)
-    context = _category_context(
-        request,
-        queryset,
-        page_title="Keyboards & Pianos",
-        page_description="Digital pianos, synthesizers, and MIDI keyboards",
-    )
-    return render(request, "store/keyboards.html", context)
+    return _render_category_page(request, KEYBOARDS_PAGE)
 
 
+@query_budget(3)
+@cached_catalog_page(*AMPS_EFFECTS_PAGE.cache_tags)
 def amps_effects_page(request):
-    """Amps and effects page.
+    """Amps and effects page, spanning categories (see `AMPS_EFFECTS_PAGE`)."""
 
-    Builds a broader queryset that looks for explicit amp/effect categories
-    or instruments whose name contains related keywords.
-    """
-
-    queryset = Instrument.objects.filter(
-        Q(category__slug="amps-effects") | Q(name__icontains="amp") | Q(name__icontains="effect") | Q(name__icontains="pedal"),
-        in_stock=True,
-    )
-    context = _category_context(
-        request,
-        queryset,
-        page_title="Amps & Effects",
-        page_description="Amplifiers, effect pedals, and audio gear",
-    )
-    return render(request, "store/amps_effects.html", context)
+    return _render_category_page(request, AMPS_EFFECTS_PAGE)
 
 
+@query_budget(1)
 def lessons_page(request):
     """Static-ish page describing music lessons offered by the store."""
 
@@ -293,33 +420,102 @@ def lessons_page(request):
     return render(request, "store/lessons.html", context)
 
 
-def get_or_create_cart(request):
-    """Return the session-backed `Cart` for the current request.
+def get_cart(request, with_items=False):
+    """Return the visitor's cart for reading without creating anything.
+
+    Visitors without a session get their `CookieCart` when
+    ``STORE_CART_STORAGE`` is ``"cookie"``, and an `EmptyCart` otherwise,
+    so viewing the cart (crawlers, health checks) writes no session or
+    cart rows. Pass `with_items=True` when the cart is going to be
+    rendered so its items, instruments and categories are prefetched.
+    Use `get_or_create_cart` before changing the cart.
+    """
 
-    If the session has no `session_key`, a new session is created. The
-    returned `Cart` is retrieved or created based on that key.
+    from .carts import CookieCart, cookie_carts_enabled
+    from .models import Cart, EmptyCart
+
+    session_key = request.session.session_key
+    if session_key:
+        carts = Cart.objects.with_items() if with_items else Cart.objects.all()
+        cart = carts.filter(session_key=session_key).first()
+        if cart is not None:
+            return cart
+    elif cookie_carts_enabled():
+        return CookieCart.from_request(request)
+    return EmptyCart()
+
+
+def get_or_create_cart(request, persistent=False, add=None):
+    """Return the cart to modify for the current request.
+
+    With cookie carts enabled, visitors without a session keep using
+    their `CookieCart` unless `persistent` is true or the cookie cart is
+    full. Otherwise a session is created if needed and the `Cart` for
+    its key is retrieved or created; any cookie cart lines are merged
+    into it. `add` (instrument id -> units) is added to the returned
+    cart, together with the merged lines. Only call this on requests
+    that modify the cart; reads use `get_cart`.
     """
 
+    from .carts import CookieCart, add_cart_items, cookie_carts_enabled, merge_cookie_cart
     from .models import Cart
 
     if not request.session.session_key:
+        if cookie_carts_enabled() and not persistent:
+            cookie_cart = CookieCart.from_request(request)
+            if not cookie_cart.full:
+                add_cart_items(cookie_cart, add)
+                return cookie_cart
         request.session.create()
-    session_key = request.session.session_key
-
-    cart, created = Cart.objects.get_or_create(session_key=session_key)
+    cart, created = Cart.objects.get_or_create(session_key=request.session.session_key)
+    merge_cookie_cart(request, cart, add, touch=not created)
     return cart
 
 
+def cart_item_count(session_key):
+    """Return the number of units in the cart stored for `session_key`."""
+
+    from django.db.models import Sum
+    from .models import CartItem
+
+    totals = CartItem.objects.filter(cart__session_key=session_key).aggregate(count=Sum("quantity"))
+    return totals["count"] or 0
+
+
+def remember_cart_count(request, count=None):
+    """Store the cart badge count in the session.
+
+    The `cart_context` processor reads this value so pages that never
+    touch the cart render the badge without querying `Cart`. Every view
+    that changes cart contents must call this afterwards; pass `count`
+    when it is already known to avoid the aggregate query.
+    """
+
+    from .carts import cookie_carts_enabled
+
+    if not request.session.session_key and (not count or cookie_carts_enabled()):
+        # No session means no cart row (or a cookie cart, which counts
+        # itself); don't create a session just for the badge
+        return
+    if count is None:
+        count = cart_item_count(request.session.session_key)
+    if request.session.get(CART_COUNT_SESSION_KEY) != count:
+        request.session[CART_COUNT_SESSION_KEY] = count
+
+
+@query_budget(4)
 def cart_view(request):
     """Display the current shopping cart and its items."""
 
-    cart = get_or_create_cart(request)
+    cart = get_cart(request, with_items=True)
     cart_items = cart.items.all()
+    remember_cart_count(request, cart.get_item_count())
 
     context = {"cart": cart, "cart_items": cart_items}
     return render(request, "store/cart.html", context)
 
 
+@query_budget(9)
 def add_to_cart(request, slug):
     """Add an instrument to the user's cart.
 
@@ -328,61 +524,93 @@ def add_to_cart(request, slug):
     """
 
     from django.shortcuts import redirect
-    from .models import CartItem
 
     instrument = get_object_or_404(Instrument, slug=slug)
-    cart = get_or_create_cart(request)
-
-    # Get or create cart item; `unique_together` on CartItem enforces
-    # one row per (cart, instrument) pair.
-    cart_item, created = CartItem.objects.get_or_create(cart=cart, instrument=instrument)
-
-    if not created:
-        # Item already in cart, increase quantity
-        cart_item.quantity += 1
-        cart_item.save()
+    # A single upsert (see `add_cart_items`), also carrying any cookie cart
+    # lines, so concurrent clicks can't lose increments or trip the
+    # `unique_together` constraint on CartItem.
+    get_or_create_cart(request, add={instrument.pk: 1})
 
+    remember_cart_count(request)
     return redirect("cart_view")
 
 
+@query_budget(6)
 def update_cart_item(request, item_id):
     """Update the quantity for a cart item from a POST form.
 
-    If the provided quantity is 0 (or invalid), the item is removed.
+    If the provided quantity is 0, the item is removed; invalid input
+    is ignored.
     """
 
     from django.shortcuts import redirect
-    from .models import CartItem
+    from .carts import set_cart_item_quantity
 
-    cart_item = get_object_or_404(CartItem, id=item_id)
+    cart = get_cart(request)
     quantity = request.POST.get("quantity", 1)
 
     try:
         quantity = int(quantity)
-        if quantity > 0:
-            cart_item.quantity = quantity
-            cart_item.save()
-        else:
-            cart_item.delete()
     except ValueError:
         # Invalid input -- ignore and redirect back to the cart
         pass
+    else:
+        if not set_cart_item_quantity(cart, item_id, quantity):
+            raise Http404("No such item in your cart")
 
+    remember_cart_count(request)
     return redirect("cart_view")
 
 
+@query_budget(6)
 def remove_from_cart(request, item_id):
-    """Remove a `CartItem` by id and return to the cart view."""
+    """Remove a cart item by id and return to the cart view."""
 
     from django.shortcuts import redirect
-    from .models import CartItem
+    from .carts import set_cart_item_quantity
+
+    if not set_cart_item_quantity(get_cart(request), item_id, 0):
+        raise Http404("No such item in your cart")
+
+    remember_cart_count(request)
+    return redirect("cart_view")
+
 
-    cart_item = get_object_or_404(CartItem, id=item_id)
-    cart_item.delete()
+@query_budget(9)
+def checkout(request):
+    """Start checkout from the current cart.
 
+    Orders are placed from a database `Cart`, so a cookie cart is merged
+    into one here (creating the session). Payment and order creation
+    build on this step; for now it returns to the cart page.
+    """
+
+    from django.shortcuts import redirect
+
+    if request.method == "POST":
+        get_or_create_cart(request, persistent=True)
+        remember_cart_count(request)
     return redirect("cart_view")
 
 
+@query_budget(0)
+def metrics(request):
+    """Request metrics of all workers in Prometheus text format (see store.metrics).
+
+    Only answers clients in ``STORE_METRICS_ALLOWED_IPS``; everyone else
+    gets a 404 so the endpoint isn't advertised.
+    """
+
+    from django.conf import settings
+    from django.http import HttpResponse
+
+    from .metrics import collect, render_prometheus
+
+    if not settings.STORE_METRICS_ENABLED or request.META.get("REMOTE_ADDR") not in settings.STORE_METRICS_ALLOWED_IPS:
+        raise Http404("Not found")
+    return HttpResponse(render_prometheus(collect()), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 def _category_to_dict(category):
     return {
         "id": category.id,
@@ -405,6 +633,7 @@ def _instrument_to_dict(instrument):
         "description": instrument.description,
         "specifications": instrument.specifications,
         "image": instrument.image_display_url,
+        "image_srcset": instrument.image_srcsets,
         "in_stock": instrument.in_stock,
         "featured": instrument.featured,
         "created_at": instrument.created_at.isoformat(),